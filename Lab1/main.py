@@ -6,6 +6,7 @@ import calendar
 
 app = Flask(__name__)
 DS = datastore.Client()
+REAP_BATCH = 500
 
 
 def _add_event(event):
@@ -33,36 +34,59 @@ def _del_event(ID):
     DS.delete(key)
 
 
-def get_all():
-    """Getting all events stored in the database.
-    Automatically delete past events.
+def get_all(limit=None):
+    """Getting upcoming events stored in the database, ordered by date.
+    Past events are deleted by the reaper.
 
     :return events: All events stored in the database.
+    @param limit: The maximum number of events, no limit if None.
     """
     query = DS.query(kind='Lab1-event')
+    query.add_filter('date', '>=', datetime.now())
+    query.order = ['date']
 
-    events = query.fetch()
+    events = query.fetch(limit=limit)
     result = []
     for event in events:
         temp = dict(event)
-        if temp['date'].timestamp() < datetime.now().timestamp():
-            DS.delete(event.key)
-            continue
         temp['ID'] = event.id
         result.append(temp)
     return result
 
 
+def _reap(kind, prop):
+    """Delete the entities of a kind whose time property has passed.
+    Only keys are fetched, and they are deleted in batches.
+
+    @param kind: The kind of entities.
+    @param prop: The name of the time property.
+    @return: The number of deleted entities.
+    """
+    query = DS.query(kind=kind)
+    query.add_filter(prop, '<', datetime.now())
+    query.keys_only()
+    count = 0
+    keys = []
+    for entity in query.fetch():
+        keys.append(entity.key)
+        if len(keys) == REAP_BATCH:
+            DS.delete_multi(keys)
+            count += len(keys)
+            keys = []
+    if keys:
+        DS.delete_multi(keys)
+        count += len(keys)
+    return count
+
+
 def events2json(events):
     """Transfer event objects into JSON format.
     Generate string of date and ETA from the date property.
-    Sort events by the ETA.
+    Events are expected to be sorted by date already.
 
     :param events: Event objects need to be transfer.
     :return: Json format events.
     """
-    events.sort(key=lambda event: event['date'])
-
     for event in events:
         timestamp = datetime.timestamp(event['date'])
         current = datetime.now().timestamp()
@@ -124,7 +148,7 @@ def add_event():
         result = None
         cur_time = datetime.now()
         for year in range(cur_time.year, cur_time.year + 8):
-            if date[1] not in calendar.monthrange(year, date[0]):
+            if not 1 <= date[0] <= 12 or not 1 <= date[1] <= calendar.monthrange(year, date[0])[1]:
                 continue
             temp = datetime(year, date[0], date[1])
             if temp > cur_time:
@@ -151,5 +175,18 @@ def del_event(event_id):
     return json.dumps({'text': 'Success! Target event has been deleted!'})
 
 
+@app.route('/tasks/reap')
+def reap():
+    """Delete past events. Requested by App Engine cron.
+
+    :return: The number of deleted entities of each kind.
+    """
+    if request.headers.get('X-Appengine-Cron') != 'true':
+        abort(403)
+    return json.dumps({
+        'Lab1-event': _reap('Lab1-event', 'date')
+    })
+
+
 if __name__ == '__main__':
     app.run(host='127.0.0.1', port=8080, debug=True)
@@ -0,0 +1,371 @@
+"""Async serving mode of the routes of main.py, on Quart.
+
+    hypercorn asgi:app --bind 0.0.0.0:8080 --workers 2
+
+Handlers await their Datastore calls, which run in the STORAGE_THREADS pool instead of blocking the event loop,
+bcrypt runs in the pool of main.py. Event streams wait on asyncio events woken by the writes of this process,
+so an idle stream or poll only holds a coroutine, not a thread.
+"""
+import asyncio
+import functools
+import hmac
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from quart import Quart, Response, g, make_response, redirect, render_template, request, send_from_directory
+
+import assets
+import compression
+import main
+import metrics
+
+app = Quart(__name__)
+_assets = assets.Assets(app.static_folder)
+app.url_defaults(_assets.url_defaults)
+_storage_pool = ThreadPoolExecutor(max_workers=int(os.environ.get('STORAGE_THREADS', 64)))
+_loop = None
+_waiters = {}
+
+
+async def _run(func, *args, pool=_storage_pool):
+    """Run a blocking function in a thread pool.
+
+    @param func: The function.
+    @param args: The arguments of the function.
+    @param pool: The thread pool.
+    @return: The result of the function.
+    """
+    return await asyncio.get_running_loop().run_in_executor(pool, functools.partial(func, *args))
+
+
+def _on_events_changed(parent_id, version):
+    """Listener of main._notify_events, called from the thread which wrote the events."""
+    if _loop is not None:
+        _loop.call_soon_threadsafe(_wake, parent_id)
+
+
+def _wake(parent_id):
+    for waiter in _waiters.get(parent_id, ()):
+        waiter.set()
+
+
+async def _wait_events(parent_id, version, timeout):
+    """Wait until the events of a user change in this process or the timeout passes.
+
+    @param parent_id: The id of the user.
+    @param version: The last version seen by the caller.
+    @param timeout: Seconds to wait at most.
+    @return: The latest version known by this process.
+    """
+    if main._event_versions.get(parent_id, 0) <= version:
+        waiter = asyncio.Event()
+        _waiters.setdefault(parent_id, set()).add(waiter)
+        try:
+            await asyncio.wait_for(waiter.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            _waiters[parent_id].discard(waiter)
+            if not _waiters[parent_id]:
+                del _waiters[parent_id]
+    return max(main._event_versions.get(parent_id, 0), version)
+
+
+async def _current_user():
+    token = request.cookies.get('token')
+    if not token:
+        return False
+    return await _run(main._search_session, token)
+
+
+@app.before_serving
+async def _start():
+    global _loop
+    _loop = asyncio.get_running_loop()
+    main._event_listeners.append(_on_events_changed)
+
+
+@app.after_serving
+async def _stop():
+    main._event_listeners.remove(_on_events_changed)
+
+
+# Registered first, so it runs after the other after_request hooks.
+@app.after_request
+async def _compress(res):
+    """Compress responses like compression.install, event streams are compressed by stream_events."""
+    encoding = compression.choose(request.accept_encodings)
+    if not compression.pending(res, encoding) or res.mimetype == 'text/event-stream':
+        return res
+    data = compression.compress_body(res, await res.get_data(), encoding, main.COMPRESS_MIN_SIZE)
+    if data is not None:
+        res.set_data(data)
+    return res
+
+
+@app.before_request
+async def _start_request():
+    g.request_start = time.perf_counter()
+    main._requests_in_flight.inc()
+
+
+@app.after_request
+async def _record_status(res):
+    g.request_status = res.status_code
+    return res
+
+
+@app.teardown_request
+async def _observe_request(exc):
+    """Observe the latency of a request like main._observe_request."""
+    if 'request_start' not in g:
+        return
+    main._requests_in_flight.dec()
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    status = g.get('request_status', 500) if exc is None else 500
+    main._request_seconds.observe(time.perf_counter() - g.request_start, route, request.method, str(status))
+
+
+@app.route('/static/dist/<path:filename>')
+async def hashed_static(filename):
+    """Send a hashed static file like the route of assets.install.
+
+    :param filename: The hashed name of the file.
+    :return: The best variant of the file for the client.
+    """
+    name, encoding, mimetype = _assets.variant(filename, request.accept_encodings)
+    res = await send_from_directory(_assets.directory, name, mimetype=mimetype)
+    if encoding:
+        res.headers['Content-Encoding'] = encoding
+    res.headers['Vary'] = 'Accept-Encoding'
+    res.headers['Cache-Control'] = assets.CACHE_CONTROL
+    return res
+
+
+@app.route('/')
+async def root():
+    """Generate the web page.
+
+    :return: Render template of web page.
+    """
+    if not await _current_user():
+        return redirect('/login')
+    return await render_template('index.html')
+
+
+@app.route('/login', methods=['POST', 'GET'])
+async def login_page():
+    """User login. Create a session if the username and password are correct.
+
+    @return: Redirect address.
+    """
+    if request.method == 'GET':
+        return await render_template('login.html')
+    try:
+        uname, passwd = main._parse_credential(await request.get_data())
+    except ValueError as e:
+        return str(e), 400
+    user_id = await _run(main._search_user, uname, passwd)
+    if not user_id:
+        return 'User name or Password is not correct!', 400
+    res = await make_response('/')
+    res.set_cookie('token', await _run(main._create_session, user_id))
+    return res
+
+
+@app.route('/signup', methods=['POST'])
+async def sign_up():
+    """Add a new user into database, create a session and then redirect to the main page.
+
+    @return: Redirect address.
+    """
+    try:
+        uname, passwd = main._parse_credential(await request.get_data())
+    except ValueError as e:
+        return str(e), 400
+    user_id = await _run(main._add_user, uname, passwd)
+    if not user_id:
+        return 'User is already exist!', 400
+    res = await make_response('/')
+    res.set_cookie('token', await _run(main._create_session, user_id))
+    return res
+
+
+@app.route('/events')
+async def send_events():
+    """Send the events of current user like main.send_events.
+
+    :return: All entities in database in json form.
+    """
+    parent_id = await _current_user()
+    if not parent_id:
+        return 'Session expired.', 401
+    try:
+        limit, cursor, days = main._parse_page_args(request.args)
+        etag, payload = await _run(main._events_response, parent_id, limit, cursor, days, request.if_none_match)
+    except ValueError as e:
+        return str(e), 400
+    res = await make_response('', 304) if payload is None else await make_response(payload)
+    res.set_etag(etag)
+    res.headers['Cache-Control'] = 'no-cache'
+    return res
+
+
+@app.route('/events/stream')
+async def stream_events():
+    """Push events to the client through Server-Sent Events like main.stream_events.
+
+    :return: A streaming response of events in json form.
+    """
+    if not main.EVENT_STREAM:
+        return '', 204
+    token = request.cookies.get('token')
+    parent_id = await _current_user()
+    if not parent_id:
+        return 'Session expired.', 401
+    try:
+        limit, _, days = main._parse_page_args(request.args)
+    except ValueError as e:
+        return str(e), 400
+    stream = main._EventStream(parent_id, token, limit, days)
+
+    async def generate():
+        main._streams_open.inc()
+        try:
+            yield (await _run(stream.start)).encode('utf-8')
+            more = True
+            while more:
+                current = await _wait_events(parent_id, stream.version, stream.timeout())
+                message, more = await _run(stream.step, current)
+                if message:
+                    yield message.encode('utf-8')
+        finally:
+            main._streams_open.dec()
+
+    encoding = compression.choose(request.accept_encodings)
+    body = generate() if encoding is None else compression.compressed_async(generate(), compression.Stream(encoding))
+    res = await make_response(body, 200, {
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    compression.negotiated(res, encoding)
+    res.timeout = None
+    return res
+
+
+@app.route('/event', methods=['POST'])
+async def add_event():
+    """Insert the event into database.
+    If the event doesn't have year, insert the next occurrence of a matching date.
+
+    :return: Status Information.
+    """
+    parent_id = await _current_user()
+    if not parent_id:
+        return 'Session expired.', 401
+    try:
+        event = main._parse_event(json.loads(await request.get_data()))
+    except ValueError as e:
+        return str(e), 400
+    new_ID = await _run(main._add_event, event, parent_id)
+    return json.dumps({'text': 'Success! The unique ID of the new event is ' + str(new_ID)})
+
+
+@app.route('/events:batch', methods=['POST'])
+async def add_events():
+    """Insert a list of events into database with a single write.
+    Each event is checked like in add_event, invalid ones are reported and skipped.
+
+    :return: The unique ID or the error of each event, in the order of the request.
+    """
+    parent_id = await _current_user()
+    if not parent_id:
+        return 'Session expired.', 401
+    try:
+        items = main._parse_batch(await request.get_data())
+    except ValueError as e:
+        return str(e), 400
+    return json.dumps({'results': await _run(main._add_results, items, parent_id)})
+
+
+@app.route('/events:batch', methods=['DELETE'])
+async def del_events():
+    """Delete a list of events according to their unique IDs with a single write.
+
+    :return: The result of each ID, in the order of the request.
+    """
+    parent_id = await _current_user()
+    if not parent_id:
+        return 'Session expired.', 401
+    try:
+        items = main._parse_batch(await request.get_data())
+    except ValueError as e:
+        return str(e), 400
+    return json.dumps({'results': await _run(main._del_results, items, parent_id)})
+
+
+@app.route('/event/<event_id>', methods=['DELETE'])
+async def del_event(event_id):
+    """Delete an event according to the unique ID generated by datastore.
+
+    :param event_id: The unique ID of target event.
+    :return: Status Information.
+    """
+    parent_id = await _current_user()
+    if not parent_id:
+        return 'Session expired.', 401
+    await _run(main._del_event, event_id, parent_id)
+    return json.dumps({'text': 'Success! Target event has been deleted!'})
+
+
+@app.route('/logout', methods=['DELETE'])
+async def logout():
+    """Delete the session in database and log out.
+
+    @return: Redirect address.
+    """
+    await _run(main._del_session, request.cookies.get('token'))
+    return json.dumps({'text': '/login'})
+
+
+@app.route('/tasks/reap')
+async def reap():
+    """Delete past events and expired sessions, move recurring events to their next occurrence.
+    Requested by App Engine cron.
+
+    :return: The number of deleted entities of each kind.
+    """
+    if request.headers.get('X-Appengine-Cron') != 'true':
+        return 'Forbidden', 403
+    return json.dumps(await _run(main._reap_all))
+
+
+@app.route('/_ah/warmup')
+async def warmup():
+    """Prepare a new instance before App Engine sends it traffic, like main.warmup.
+
+    :return: An empty response.
+    """
+    await _run(main._warm_up)
+    for name in ('index.html', 'login.html'):
+        app.jinja_env.get_template(name)
+    return ''
+
+
+@app.route('/metrics')
+async def metrics_page():
+    """Expose the metrics of this process in the Prometheus text format, like main.metrics_page.
+
+    :return: The metrics.
+    """
+    if not main.METRICS_TOKEN or not hmac.compare_digest(request.headers.get('Authorization', ''),
+                                                         'Bearer ' + main.METRICS_TOKEN):
+        return 'Forbidden', 403
+    return Response(main.METRICS.render(), content_type=metrics.CONTENT_TYPE)
+
+
+if __name__ == '__main__':
+    app.run(host='127.0.0.1', port=8080)
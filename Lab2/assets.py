@@ -0,0 +1,137 @@
+"""Fingerprinted and precompressed static files.
+
+Build them before deploying, from the directory of the app:
+
+    python assets.py
+
+Each file of static/ is copied to static/dist/ with the first 12 hex digits of its SHA-256 in the name,
+next to a gzip variant and, if the brotli package is installed, a brotli one.
+static/dist/manifest.json maps the names to the hashed names, so url_for('static', filename='index.js')
+in the templates points to the current build. A hashed name never changes its content,
+so it is sent with a year-long immutable Cache-Control. Without a build the names are left as they are.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Content-Encoding and suffix of the variants, in order of preference.
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def _hashed_name(name, data):
+    root, ext = os.path.splitext(name)
+    return '%s.%s%s' % (root, hashlib.sha256(data).hexdigest()[:12], ext)
+
+
+def build(static_dir):
+    """Write the hashed files, their compressed variants and the manifest into static/dist.
+
+    @param static_dir: The static directory of the app.
+    @return: The manifest.
+    """
+    out = os.path.join(static_dir, DIST)
+    shutil.rmtree(out, ignore_errors=True)
+    os.makedirs(out)
+    manifest = {}
+    for name in sorted(os.listdir(static_dir)):
+        path = os.path.join(static_dir, name)
+        if not os.path.isfile(path):
+            continue
+        with open(path, 'rb') as f:
+            data = f.read()
+        hashed = _hashed_name(name, data)
+        with open(os.path.join(out, hashed), 'wb') as f:
+            f.write(data)
+        # mtime 0 keeps the variant identical between builds of the same file.
+        with open(os.path.join(out, hashed + '.gz'), 'wb') as f:
+            f.write(gzip.compress(data, compresslevel=9, mtime=0))
+        if brotli is not None:
+            with open(os.path.join(out, hashed + '.br'), 'wb') as f:
+                f.write(brotli.compress(data, quality=11))
+        manifest[name] = DIST + '/' + hashed
+    with open(os.path.join(out, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+class Assets:
+    """Resolve the names of static files through the manifest of the last build."""
+
+    def __init__(self, static_dir):
+        """
+        @param static_dir: The static directory of the app.
+        """
+        self.directory = os.path.join(static_dir, DIST)
+        try:
+            with open(os.path.join(self.directory, MANIFEST)) as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            self.manifest = {}
+
+    def url_defaults(self, endpoint, values):
+        """A url_defaults hook replacing the filename of the static endpoint by its hashed name."""
+        if endpoint == 'static' and values.get('filename') in self.manifest:
+            values['filename'] = self.manifest[values['filename']]
+
+    def variant(self, filename, accept_encodings):
+        """Choose the variant of a hashed file for a client.
+
+        @param filename: The name of the file in static/dist.
+        @param accept_encodings: The Accept-Encoding header of the request, parsed.
+        @return: The name of the variant, its Content-Encoding or None, and the mimetype of the file.
+        """
+        mimetype = mimetypes.guess_type(filename)[0]
+        for encoding, suffix in ENCODINGS:
+            if accept_encodings[encoding] and os.path.isfile(os.path.join(self.directory, filename + suffix)):
+                return filename + suffix, encoding, mimetype
+        return filename, None, mimetype
+
+
+def install(app):
+    """Resolve the static files of a Flask app through the manifest and serve the hashed ones.
+
+    App Engine serves static/dist itself by the handler in app.yaml,
+    the route serves it when the app runs elsewhere.
+
+    @param app: The Flask app.
+    @return: The assets.
+    """
+    from flask import request, send_from_directory
+
+    assets = Assets(app.static_folder)
+    app.url_defaults(assets.url_defaults)
+
+    @app.route('/static/dist/<path:filename>')
+    def hashed_static(filename):
+        name, encoding, mimetype = assets.variant(filename, request.accept_encodings)
+        res = send_from_directory(assets.directory, name, mimetype=mimetype)
+        if encoding:
+            res.headers['Content-Encoding'] = encoding
+        res.headers['Vary'] = 'Accept-Encoding'
+        res.headers['Cache-Control'] = CACHE_CONTROL
+        return res
+
+    return assets
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build the fingerprinted and precompressed static files.')
+    parser.add_argument('static_dir', nargs='?', default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                      'static'))
+    args = parser.parse_args()
+    if brotli is None:
+        print('brotli is not installed, only gzip variants are built.')
+    for name, hashed in sorted(build(args.static_dir).items()):
+        print('%-12s -> %s' % (name, hashed))
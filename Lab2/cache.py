@@ -0,0 +1,230 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """A bounded, thread-safe cache.
+    Every entry expires at its own time, the least recently used entry is evicted when the cache is full.
+    """
+
+    def __init__(self, maxsize=1024):
+        """
+        @param maxsize: The maximum number of entries.
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Get an entry which is not expired.
+
+        @param key: The key of the entry.
+        @param default: The value returned when the entry is missing or expired.
+        @return: The cached value.
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[1] > time.time():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[0]
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value, expire):
+        """Store an entry.
+
+        @param key: The key of the entry.
+        @param value: The value to be cached.
+        @param expire: The timestamp when the entry expires.
+        """
+        with self._lock:
+            self._data[key] = (value, expire)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key):
+        """Invalidate an entry.
+
+        @param key: The key of the entry.
+        """
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Invalidate all entries."""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class EventCache:
+    """A memory bounded LRU cache of the upcoming events of users.
+    An entry is tagged with the version of the user's events it was read at, a newer version makes it a miss.
+    It also expires when its earliest event passes, because the event is no longer upcoming.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        """
+        @param max_bytes: The estimated memory all entries may take.
+        """
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._users = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _sizeof(events):
+        return 256 + sum(200 + len(event['name']) for event in events)
+
+    @staticmethod
+    def _expire(events):
+        if not events:
+            return float('inf')
+        return events[0]['date'].timestamp()
+
+    def get(self, key, version):
+        """Get the events of a user read at the given version.
+
+        @param key: A tuple starting with the id of the user, then anything identifying the selection of events.
+        @param version: The current version of the user's events.
+        @return: A copy of the events and the cursor of the next page, None if there is no valid entry.
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] != version or item[3] <= time.time():
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return [dict(event) for event in item[1]], item[2]
+
+    def set(self, key, version, events, next_cursor=None):
+        """Store the events of a user.
+
+        @param key: A tuple starting with the id of the user, then anything identifying the selection of events.
+        @param version: The version of the user's events read before the events.
+        @param events: The events sorted by date.
+        @param next_cursor: The cursor of the next page if the events are a page.
+        """
+        events = [dict(event) for event in events]
+        with self._lock:
+            self._store(key, (version, events, next_cursor, self._expire(events), self._sizeof(events)))
+
+    def update(self, parent_id, version, added=None, deleted=None):
+        """Apply a write of a user to the cached list of all their events.
+        The list is kept if it was read at the version right before the write, other entries of the user are dropped.
+
+        @param parent_id: The id of the user.
+        @param version: The version of the user's events after the write.
+        @param added: The upcoming event added by the write.
+        @param deleted: The ID of the event deleted by the write.
+        """
+        key = (parent_id, None, None)
+        with self._lock:
+            item = self._data.get(key)
+            for other in list(self._users.get(parent_id, ())):
+                self._remove(other)
+            if item is None or item[0] != version - 1:
+                return
+            # A read between the write and its version bump may have cached the added event already.
+            dropped = {deleted, added['ID'] if added is not None else None}
+            events = [event for event in item[1] if event['ID'] not in dropped]
+            if added is not None:
+                position = 0
+                while position < len(events) and events[position]['date'] <= added['date']:
+                    position += 1
+                events.insert(position, dict(added))
+            self._store(key, (version, events, None, self._expire(events), self._sizeof(events)))
+
+    def pop(self, parent_id):
+        """Invalidate all entries of a user.
+
+        @param parent_id: The id of the user.
+        """
+        with self._lock:
+            for key in list(self._users.get(parent_id, ())):
+                self._remove(key)
+
+    def _store(self, key, item):
+        self._remove(key)
+        self._data[key] = item
+        self._users.setdefault(key[0], set()).add(key)
+        self._bytes += item[4]
+        while self._bytes > self.max_bytes and self._data:
+            self._remove(next(iter(self._data)))
+
+    def _remove(self, key):
+        item = self._data.pop(key, None)
+        if item is None:
+            return
+        self._bytes -= item[4]
+        keys = self._users[key[0]]
+        keys.discard(key)
+        if not keys:
+            del self._users[key[0]]
+
+    def __len__(self):
+        return len(self._data)
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesce concurrent calls with the same key.
+    The first caller runs the function, callers arriving while it runs wait and share its result or exception.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.saved = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, *args):
+        """Call a function, or wait for the call in flight with the same key.
+
+        @param key: The key identifying the call.
+        @param func: The function.
+        @param args: The arguments of the function.
+        @return: The result of the function.
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.calls += 1
+            else:
+                self.saved += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func(*args)
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
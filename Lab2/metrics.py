@@ -0,0 +1,169 @@
+"""Metrics of the app in the Prometheus text format.
+
+Counters, gauges and histograms keep their values per combination of label values in a dict under their own lock,
+so recording a value costs a dict lookup and a few additions.
+Callback metrics read their values from the rest of the app, e.g. the hit counters of caches, when they are rendered.
+"""
+import bisect
+import threading
+
+# Seconds, from a cache hit to a slow Datastore query.
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = ['%s="%s"' % (name, _escape(value)) for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(pairs) + '}'
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+        if not self.labels and self.kind in ('counter', 'gauge'):
+            self._values[()] = 0
+
+    def _header(self):
+        return ['# HELP %s %s' % (self.name, self.help), '# TYPE %s %s' % (self.name, self.kind)]
+
+    def render(self):
+        with self._lock:
+            values = dict(self._values)
+        lines = self._header()
+        for labels, value in sorted(values.items()):
+            lines.append(self.name + _labels(self.labels, labels) + ' ' + _number(value))
+        return lines
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        """Increase the counter of the given label values."""
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def inc(self, *labels, amount=1):
+        """Increase the gauge of the given label values."""
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        """Decrease the gauge of the given label values."""
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value, *labels):
+        """Set the gauge of the given label values."""
+        with self._lock:
+            self._values[labels] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels, buckets=BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        """Record a value, e.g. the seconds an operation took, under the given label values."""
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            item = self._values.get(labels)
+            if item is None:
+                item = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            item[0][index] += 1
+            item[1] += value
+
+    def render(self):
+        with self._lock:
+            values = {labels: (list(item[0]), item[1]) for labels, item in self._values.items()}
+        lines = self._header()
+        for labels, (counts, total) in sorted(values.items()):
+            count = 0
+            for bound, bucket in zip(self.buckets + (float('inf'),), counts):
+                count += bucket
+                lines.append('%s_bucket%s %d' % (
+                    self.name, _labels(self.labels, labels, 'le="%s"' % _number(bound)), count))
+            lines.append('%s_sum%s %s' % (self.name, _labels(self.labels, labels), repr(total)))
+            lines.append('%s_count%s %d' % (self.name, _labels(self.labels, labels), count))
+        return lines
+
+
+class Callback(_Metric):
+    """A counter or gauge whose values are read from a function when it is rendered."""
+
+    def __init__(self, name, help, labels, kind, func):
+        super().__init__(name, help, labels)
+        self.kind = kind
+        self._func = func
+
+    def render(self):
+        lines = self._header()
+        for labels, value in sorted(self._func().items()):
+            lines.append(self.name + _labels(self.labels, labels) + ' ' + _number(value))
+        return lines
+
+
+class Registry:
+    """The metrics of a process."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self._add(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def callback(self, name, help, labels, kind, func):
+        """Add a metric read from a function.
+
+        @param kind: counter or gauge.
+        @param func: A function returning the value of each tuple of label values.
+        """
+        return self._add(Callback(name, help, labels, kind, func))
+
+    def render(self):
+        """Render all metrics in the Prometheus text format.
+
+        @return: The text.
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
@@ -1,60 +1,235 @@
+"""Migrate the events of Lab1 to a user of Lab2.
+
+The source kind is read page by page with query cursors and written in put_multi batches by a pool of workers.
+The cursor of the last page written is saved to a checkpoint file, so an interrupted migration resumes from there.
+The checkpoint records the user it migrates to, and is not resumed by a migration to another user.
+Migrated events keep their Lab1 IDs, writing a page twice does not duplicate it.
+
+    python migration.py --user <uname> [--batch-size 500] [--workers 8] [--checkpoint FILE] [--dry-run]
+
+Users stored before users were keyed by name get their normalized name saved as uname_key,
+so signup rejects every spelling of their name:
+
+    python migration.py --backfill-users [--batch-size 500]
+"""
+import argparse
+import collections
+import json
+import os
+import sys
+import time
+import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+
 from google.cloud import datastore
 
 DS = datastore.Client()
 
 
-def add_event(event, parent_id):
-    """Adding the event to the database.
+def convert(event, parent_id):
+    """Convert a Lab1 event to a Lab2 event of a user.
 
-    :return: The unique ID of the new event.
-    :param event:The event need to be added to the database.
+    :param event: The Lab1 event entity.
+    :param parent_id: The id of the user who owns the events.
+    :return: The Lab2 event entity.
     """
-    entity = datastore.Entity(key=DS.key('Lab2-event', parent=DS.key('Lab2-user', parent_id)))
+    entity = datastore.Entity(key=DS.key('Lab2-user', parent_id, 'Lab2-event', event.key.id))
     entity.update({
         'name': event['name'],
         'date': event['date']
     })
+    return entity
+
+
+def get_pages(cursor, batch_size):
+    """Read the Lab1 events page by page.
+
+    :param cursor: The cursor to start from, None to start from the beginning.
+    :param batch_size: The number of events in a page.
+    :return: A generator of the events of a page and the cursor after it.
+    """
+    while True:
+        query = DS.query(kind='Lab1-event')
+        iterator = query.fetch(start_cursor=cursor, limit=batch_size)
+        events = list(next(iterator.pages))
+        if not events:
+            return
+        cursor = iterator.next_page_token
+        if isinstance(cursor, bytes):
+            cursor = cursor.decode('ascii')
+        yield events, cursor
+        if not cursor:
+            return
+
+
+def normalize_uname(uname):
+    """Normalize a user name like main._normalize_uname.
+
+    :param uname: User name.
+    :return: The name of the user's key.
+    """
+    return unicodedata.normalize('NFKC', uname).strip().casefold()
+
+
+def get_parent(uname):
+    """Find the user who receives the events.
 
-    DS.put(entity)
-    return entity.id
+    :param uname: User name.
+    :return: The id of the user, None if the user does not exist.
+    """
+    user = DS.get(DS.key('Lab2-user', normalize_uname(uname)))
+    if user is not None:
+        return user.key.name
+    # Users stored before users were keyed by name.
+    query = DS.query(kind='Lab2-user')
+    query.add_filter('uname', '=', uname)
+    for user in query.fetch(limit=1):
+        return user.key.id_or_name
+    return None
 
 
-def _del_event(ID):
-    """Delete an event according to its unique ID.
+def bump_version(parent_id):
+    """Increase the version of the user's events, so clients holding the old list fetch it again.
 
-    :param ID:The unique id of target event
+    :param parent_id: The id of the user.
     """
-    key = DS.key('Lab2-event', int(ID))
-    DS.delete(key)
+    key = DS.key('Lab2-user', parent_id, 'Lab2-version', 'events')
+    with DS.transaction():
+        entity = DS.get(key)
+        if entity is None:
+            entity = datastore.Entity(key=key)
+            entity['version'] = 0
+        entity['version'] += 1
+        DS.put(entity)
 
 
-def get_all():
-    """Getting all events stored in the old database.
+def backfill_users(batch_size):
+    """Save the normalized name of every user stored before users were keyed by name.
 
-    :return events: All events stored in the database.
+    :param batch_size: The number of users read and written at a time.
+    :return: The number of users updated.
     """
-    query = DS.query(kind='Lab1-event')
+    count = 0
+    cursor = None
+    while True:
+        iterator = DS.query(kind='Lab2-user').fetch(start_cursor=cursor, limit=batch_size)
+        users = list(next(iterator.pages))
+        changed = [user for user in users
+                   if user.key.name is None and user.get('uname_key') != normalize_uname(user['uname'])]
+        for user in changed:
+            user['uname_key'] = normalize_uname(user['uname'])
+        if changed:
+            DS.put_multi(changed)
+        count += len(changed)
+        cursor = iterator.next_page_token
+        if not users or not cursor:
+            break
+    print('Backfilled %d users.' % count)
+    return count
+
+
+def load_checkpoint(path, parent_id):
+    """Load the progress of an interrupted migration.
+
+    :param path: The checkpoint file.
+    :param parent_id: The id of the user who receives the events.
+    :return: The cursor to resume from and the number of events migrated.
+    :raise ValueError: If the checkpoint belongs to a migration to another user.
+    """
+    if not os.path.exists(path):
+        return None, 0
+    with open(path) as f:
+        checkpoint = json.load(f)
+    if 'user' not in checkpoint:
+        raise ValueError('The checkpoint %s does not record its user. '
+                         'Remove it or pass another --checkpoint.' % path)
+    if checkpoint['user'] != parent_id:
+        raise ValueError('The checkpoint %s belongs to a migration to user %r, not %r. '
+                         'Remove it or pass another --checkpoint.' % (path, checkpoint['user'], parent_id))
+    return checkpoint['cursor'], checkpoint['migrated']
+
+
+def save_checkpoint(path, parent_id, cursor, migrated):
+    """Save the progress of the migration atomically.
+
+    :param path: The checkpoint file.
+    :param parent_id: The id of the user who receives the events.
+    :param cursor: The cursor after the last page written.
+    :param migrated: The number of events migrated.
+    """
+    with open(path + '.tmp', 'w') as f:
+        json.dump({'user': parent_id, 'cursor': cursor, 'migrated': migrated}, f)
+    os.replace(path + '.tmp', path)
 
-    events = query.fetch()
-    result = []
-    for event in events:
-        temp = dict(event)
-        temp['ID'] = event.id
-        result.append(temp)
-    return result
 
+def migrate(parent_id, batch_size, workers, checkpoint, dry_run):
+    """Copy all Lab1 events to a Lab2 user.
 
-def get_parent():
-    query = DS.query(kind='Lab2-user')
-    events = query.fetch()
-    for event in events:
-        return event.id
+    :param parent_id: The id of the user who receives the events.
+    :param batch_size: The number of events read and written at a time.
+    :param workers: The number of concurrent writes.
+    :param checkpoint: The checkpoint file.
+    :param dry_run: Read and convert the events without writing anything.
+    :return: The number of events migrated by this run.
+    :raise ValueError: If the checkpoint belongs to a migration to another user.
+    """
+    cursor, migrated = load_checkpoint(checkpoint, parent_id)
+    if cursor:
+        print('Resuming after %d events.' % migrated)
+    start = time.time()
+    count = 0
+    pending = collections.deque()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for events, cursor in get_pages(cursor, batch_size):
+            entities = [convert(event, parent_id) for event in events]
+            if dry_run:
+                future = pool.submit(len, entities)
+            else:
+                future = pool.submit(DS.put_multi, entities)
+            pending.append((future, cursor, len(entities)))
+            # Checkpoint pages in the order they were read, so the cursor never skips an unwritten page.
+            while pending and (pending[0][0].done() or len(pending) > workers * 2):
+                future, done_cursor, size = pending.popleft()
+                future.result()
+                count += size
+                if not dry_run:
+                    save_checkpoint(checkpoint, parent_id, done_cursor, migrated + count)
+                print('%d events, %.1f events/s' % (migrated + count, count / (time.time() - start)))
+        while pending:
+            future, done_cursor, size = pending.popleft()
+            future.result()
+            count += size
+            if not dry_run:
+                save_checkpoint(checkpoint, parent_id, done_cursor, migrated + count)
+    if count and not dry_run:
+        bump_version(parent_id)
+
+    elapsed = time.time() - start
+    print('%s %d events in %.1fs, %.1f events/s.' % ('Read' if dry_run else 'Migrated', count, elapsed,
+                                                     count / elapsed if elapsed else 0))
+    return count
 
 
 if __name__ == '__main__':
-    parent_id = get_parent()
-    events = get_all()
-    for event in events:
-        add_event(event, parent_id)
-    # for event in events:
-    #     _del_event(event['ID'])
+    parser = argparse.ArgumentParser(description='Migrate Lab1 events to a Lab2 user.')
+    parser.add_argument('--user', help='the user name of the Lab2 user who receives the events')
+    parser.add_argument('--backfill-users', action='store_true',
+                        help='save the normalized names of users stored before users were keyed by name')
+    parser.add_argument('--batch-size', type=int, default=500, help='events per read and write (max 500)')
+    parser.add_argument('--workers', type=int, default=8, help='concurrent writes')
+    parser.add_argument('--checkpoint', default='migration.checkpoint', help='file to save the progress to')
+    parser.add_argument('--dry-run', action='store_true', help='read and convert without writing')
+    args = parser.parse_args()
+
+    if args.backfill_users:
+        backfill_users(min(args.batch_size, 500))
+        sys.exit()
+    if not args.user:
+        parser.error('--user is required')
+    parent_id = get_parent(args.user)
+    if parent_id is None:
+        sys.exit('User ' + args.user + ' does not exist.')
+    try:
+        migrate(parent_id, min(args.batch_size, 500), args.workers, args.checkpoint, args.dry_run)
+    except ValueError as e:
+        sys.exit(str(e))
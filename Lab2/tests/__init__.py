@@ -0,0 +1,6 @@
+"""Tests of the modules of Lab2.
+
+Run them from the directory of the app:
+
+    python -m pytest tests
+"""
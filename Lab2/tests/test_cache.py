@@ -0,0 +1,130 @@
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from cache import EventCache, SingleFlight
+
+
+def event(ID, days):
+    return {'ID': ID, 'name': 'event %d' % ID, 'date': datetime.now(timezone.utc) + timedelta(days=days)}
+
+
+class EventCacheUpdateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = EventCache()
+        self.events = [event(1, 1), event(2, 3)]
+        self.cache.set((7, None, None), 4, self.events)
+
+    def ids(self, version):
+        events, _ = self.cache.get((7, None, None), version)
+        return [event['ID'] for event in events]
+
+    def test_add_in_date_order(self):
+        self.cache.update(7, 5, added=event(3, 2))
+        self.assertEqual(self.ids(5), [1, 3, 2])
+
+    def test_add_after_all(self):
+        self.cache.update(7, 5, added=event(3, 10))
+        self.assertEqual(self.ids(5), [1, 2, 3])
+
+    def test_delete(self):
+        self.cache.update(7, 5, deleted=1)
+        self.assertEqual(self.ids(5), [2])
+
+    def test_added_event_already_cached(self):
+        # Read between the write and its version bump, the list already holds the new event.
+        added = event(3, 2)
+        self.cache.set((7, None, None), 4, self.events + [added])
+        self.cache.update(7, 5, added=added)
+        self.assertEqual(self.ids(5), [1, 3, 2])
+
+    def test_version_gap_drops_entry(self):
+        self.cache.update(7, 6, added=event(3, 2))
+        self.assertIsNone(self.cache.get((7, None, None), 6))
+        self.assertIsNone(self.cache.get((7, None, None), 4))
+
+    def test_drops_pages_of_user(self):
+        self.cache.set((7, 50, None), 4, self.events, 'cursor')
+        self.cache.set((8, 50, None), 1, self.events, 'cursor')
+        self.cache.update(7, 5, deleted=2)
+        self.assertIsNone(self.cache.get((7, 50, None), 4))
+        self.assertIsNotNone(self.cache.get((8, 50, None), 1))
+
+    def test_without_cached_list(self):
+        cache = EventCache()
+        cache.update(7, 1, added=event(3, 2))
+        self.assertEqual(len(cache), 0)
+
+    def test_get_returns_copies(self):
+        events, _ = self.cache.get((7, None, None), 4)
+        events[0]['name'] = 'changed'
+        self.cache.update(7, 5, added=event(3, 2))
+        self.assertEqual(self.cache.get((7, None, None), 5)[0][0]['name'], 'event 1')
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def run_concurrently(self, flight, key, func, count=5):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.call(flight, key, func)))
+                   for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        return threads, results
+
+    @staticmethod
+    def call(flight, key, func):
+        try:
+            return flight.do(key, func)
+        except ValueError as e:
+            return e
+
+    def test_concurrent_calls_share_one_run(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        runs = []
+
+        def read():
+            runs.append(1)
+            release.wait(5)
+            return 'events'
+
+        threads, results = self.run_concurrently(flight, 'key', read)
+        while flight.calls + flight.saved < len(threads):
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(runs), 1)
+        self.assertEqual(results, ['events'] * len(threads))
+        self.assertEqual((flight.calls, flight.saved), (1, len(threads) - 1))
+
+    def test_error_is_shared(self):
+        flight = SingleFlight()
+        release = threading.Event()
+        error = ValueError('Cursor is invalid!')
+
+        def read():
+            release.wait(5)
+            raise error
+
+        threads, results = self.run_concurrently(flight, 'key', read)
+        while flight.calls + flight.saved < len(threads):
+            time.sleep(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [error] * len(threads))
+
+    def test_sequential_calls_run_again(self):
+        flight = SingleFlight()
+        self.assertEqual(flight.do('key', lambda: 1), 1)
+        self.assertEqual(flight.do('key', lambda: 2), 2)
+        self.assertEqual(flight.do('other', lambda: 3), 3)
+        self.assertEqual((flight.calls, flight.saved), (3, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
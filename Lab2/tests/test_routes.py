@@ -0,0 +1,71 @@
+import os
+import unittest
+
+os.environ.setdefault('STORAGE_BACKEND', 'memory')
+
+from werkzeug.datastructures import ETags
+
+import main
+
+USER = 'ann'
+
+
+class BatchTest(unittest.TestCase):
+
+    def setUp(self):
+        main.DS.load()._entities.clear()
+
+    def test_add_results_keep_request_order(self):
+        results = main._add_results([{'name': 'a', 'date': '2099/01/01'}, {'name': ''},
+                                     {'name': 'b', 'date': '2098/01/01'}], USER)
+        self.assertEqual(results[1], {'error': 'Name cannot be empty!'})
+        self.assertEqual(sorted(event['ID'] for event in main.get_all(USER)), [results[0]['ID'], results[2]['ID']])
+
+    def test_del_results(self):
+        ID = main._add_results([{'name': 'a', 'date': '2099/01/01'}], USER)[0]['ID']
+        self.assertEqual(main._del_results([ID, 'x', ID + 1], USER), [
+            {'ID': ID, 'deleted': True},
+            {'ID': 'x', 'error': 'ID is invalid!'},
+            {'ID': ID + 1, 'error': 'Event not found!'}])
+        self.assertEqual(main.get_all(USER), [])
+
+
+class EventsResponseTest(unittest.TestCase):
+
+    def setUp(self):
+        main.DS.load()._entities.clear()
+        main._add_results([{'name': 'a', 'date': '2099/01/01'}], USER)
+
+    def test_not_modified(self):
+        etag, payload = main._events_response(USER, None, None, None, ETags())
+        self.assertIn('"a"', payload)
+        self.assertEqual(main._events_response(USER, None, None, None, ETags([etag])), (etag, None))
+
+    def test_changed(self):
+        etag, _ = main._events_response(USER, None, None, None, ETags())
+        main._add_results([{'name': 'b', 'date': '2098/01/01'}], USER)
+        new_etag, payload = main._events_response(USER, None, None, None, ETags([etag]))
+        self.assertNotEqual(new_etag, etag)
+        self.assertIn('"b"', payload)
+
+
+class EventStreamTest(unittest.TestCase):
+
+    def setUp(self):
+        main.DS.load()._entities.clear()
+        self.token = main._create_session(USER)
+
+    def test_sends_changes(self):
+        stream = main._EventStream(USER, self.token, None, None)
+        self.assertTrue(stream.start().startswith('retry: 1000\ndata: []'))
+        self.assertEqual(stream.step(stream.version), (': keep-alive\n\n', True))
+        main._add_results([{'name': 'a', 'date': '2099/01/01'}], USER)
+        message, more = stream.step(stream.version)
+        self.assertTrue(more)
+        self.assertIn('"a"', message)
+
+    def test_ends_when_session_expires(self):
+        stream = main._EventStream(USER, self.token, None, None)
+        stream.start()
+        main._del_session(self.token)
+        self.assertEqual(stream.step(stream.version), ('event: expired\ndata: /login\n\n', False))
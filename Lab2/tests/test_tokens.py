@@ -0,0 +1,33 @@
+import unittest
+
+import tokens
+
+SECRET = b'secret'
+
+
+class TokensTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        payload = {'sub': 42, 'exp': 1900000000, 'nonce': 'abc'}
+        self.assertEqual(tokens.verify(tokens.sign(payload, SECRET), SECRET), payload)
+
+    def test_wrong_secret(self):
+        self.assertIsNone(tokens.verify(tokens.sign({'sub': 42}, SECRET), b'other'))
+
+    def test_tampered_payload(self):
+        token = tokens.sign({'sub': 42}, SECRET)
+        forged = tokens.sign({'sub': 43}, SECRET)
+        self.assertIsNone(tokens.verify(forged.split('.')[0] + '.' + token.split('.')[1], SECRET))
+
+    def test_tampered_signature(self):
+        body, signature = tokens.sign({'sub': 42}, SECRET).split('.')
+        flipped = ('A' if signature[0] != 'A' else 'B') + signature[1:]
+        self.assertIsNone(tokens.verify(body + '.' + flipped, SECRET))
+
+    def test_malformed(self):
+        for token in (None, '', 'abc', 'a.b.c', '.', 'é.é', tokens.sign({'sub': 42}, SECRET) + '.x'):
+            self.assertIsNone(tokens.verify(token, SECRET), token)
+
+
+if __name__ == '__main__':
+    unittest.main()
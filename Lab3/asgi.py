@@ -0,0 +1,419 @@
+"""Async serving mode of the routes of main.py, on Quart.
+
+    hypercorn asgi:app --bind 0.0.0.0:8080 --workers 2
+
+Handlers await their Datastore calls, which run in the STORAGE_THREADS pool instead of blocking the event loop,
+and the authorization code is exchanged with an async HTTP client.
+Event streams wait on asyncio events woken by the writes of this process,
+so an idle stream or poll only holds a coroutine, not a thread.
+"""
+import asyncio
+import functools
+import hmac
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+import httpx
+from quart import Quart, Response, g, make_response, redirect, render_template, request, send_from_directory
+
+import assets
+import compression
+import main
+import metrics
+import oidc
+
+app = Quart(__name__)
+_assets = assets.Assets(app.static_folder)
+app.url_defaults(_assets.url_defaults)
+_storage_pool = ThreadPoolExecutor(max_workers=int(os.environ.get('STORAGE_THREADS', 64)))
+_loop = None
+_waiters = {}
+_http = None
+
+
+async def _run(func, *args, pool=_storage_pool):
+    """Run a blocking function in a thread pool.
+
+    @param func: The function.
+    @param args: The arguments of the function.
+    @param pool: The thread pool.
+    @return: The result of the function.
+    """
+    return await asyncio.get_running_loop().run_in_executor(pool, functools.partial(func, *args))
+
+
+def _on_events_changed(parent_id, version):
+    """Listener of main._notify_events, called from the thread which wrote the events."""
+    if _loop is not None:
+        _loop.call_soon_threadsafe(_wake, parent_id)
+
+
+def _wake(parent_id):
+    for waiter in _waiters.get(parent_id, ()):
+        waiter.set()
+
+
+async def _wait_events(parent_id, version, timeout):
+    """Wait until the events of a user change in this process or the timeout passes.
+
+    @param parent_id: The id of the user.
+    @param version: The last version seen by the caller.
+    @param timeout: Seconds to wait at most.
+    @return: The latest version known by this process.
+    """
+    if main._event_versions.get(parent_id, 0) <= version:
+        waiter = asyncio.Event()
+        _waiters.setdefault(parent_id, set()).add(waiter)
+        try:
+            await asyncio.wait_for(waiter.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            _waiters[parent_id].discard(waiter)
+            if not _waiters[parent_id]:
+                del _waiters[parent_id]
+    return max(main._event_versions.get(parent_id, 0), version)
+
+
+async def _current_user():
+    token = request.cookies.get('session')
+    if not token:
+        return False
+    return await _run(main._search_session, token)
+
+
+@app.before_serving
+async def _start():
+    global _loop, _http
+    _loop = asyncio.get_running_loop()
+    _http = httpx.AsyncClient(timeout=httpx.Timeout(oidc.TIMEOUT[1], connect=oidc.TIMEOUT[0]))
+    main._event_listeners.append(_on_events_changed)
+
+
+@app.after_serving
+async def _stop():
+    main._event_listeners.remove(_on_events_changed)
+    await _http.aclose()
+
+
+# Registered first, so it runs after the other after_request hooks.
+@app.after_request
+async def _compress(res):
+    """Compress responses like compression.install, event streams are compressed by stream_events."""
+    encoding = compression.choose(request.accept_encodings)
+    if not compression.pending(res, encoding) or res.mimetype == 'text/event-stream':
+        return res
+    data = compression.compress_body(res, await res.get_data(), encoding, main.COMPRESS_MIN_SIZE)
+    if data is not None:
+        res.set_data(data)
+    return res
+
+
+@app.before_request
+async def _start_request():
+    g.request_start = time.perf_counter()
+    main._requests_in_flight.inc()
+
+
+@app.after_request
+async def _record_status(res):
+    g.request_status = res.status_code
+    return res
+
+
+@app.teardown_request
+async def _observe_request(exc):
+    """Observe the latency of a request like main._observe_request."""
+    if 'request_start' not in g:
+        return
+    main._requests_in_flight.dec()
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    status = g.get('request_status', 500) if exc is None else 500
+    main._request_seconds.observe(time.perf_counter() - g.request_start, route, request.method, str(status))
+
+
+@app.route('/static/dist/<path:filename>')
+async def hashed_static(filename):
+    """Send a hashed static file like the route of assets.install.
+
+    :param filename: The hashed name of the file.
+    :return: The best variant of the file for the client.
+    """
+    name, encoding, mimetype = _assets.variant(filename, request.accept_encodings)
+    res = await send_from_directory(_assets.directory, name, mimetype=mimetype)
+    if encoding:
+        res.headers['Content-Encoding'] = encoding
+    res.headers['Vary'] = 'Accept-Encoding'
+    res.headers['Cache-Control'] = assets.CACHE_CONTROL
+    return res
+
+
+@app.route('/')
+async def root():
+    """Redirect user to login page or main page.
+    Check for session token to decide which url should be redirected to.
+
+    :return: Redirect response.
+    """
+    token = request.cookies.get('state')
+    if not token or not await _run(main._search_session, token):
+        return redirect('/login')
+    return redirect('/oidauth')
+
+
+@app.route('/login')
+async def login_page():
+    """Show the login page.
+
+    @return: The login page.
+    """
+    return await render_template('login.html')
+
+
+@app.route('/login_google')
+async def google_login():
+    """Generate the URL of the Google login page.
+
+    @return: The URL of the authorization endpoint.
+    """
+    client_credential = await _run(main.get_client_credential)
+    config = await _run(main.OIDC.config)
+    state, nonce, cookie = main._new_login()
+    res = await make_response(config['authorization_endpoint'] + '?' + urlencode({
+        'response_type': 'code',
+        'client_id': client_credential['ID'],
+        'scope': 'openid email',
+        'redirect_uri': main.OIDC_REDIRECT_URI,
+        'state': state,
+        'nonce': nonce
+    }))
+    res.set_cookie(main.OIDC_COOKIE, cookie, max_age=main.OIDC_LOGIN_TTL, httponly=True,
+                   secure=request.scheme == 'https')
+    return res
+
+
+@app.route('/oidauth')
+async def main_page():
+    """Check the state like main.main_page, exchange the authorization code,
+    verify the ID token and its nonce and create a session of the user.
+
+    @return: The main page.
+    """
+    nonce = main._login_nonce(request.cookies.get(main.OIDC_COOKIE), request.args.get('state'))
+    if nonce is None:
+        return 'Login failed.', 401
+    cred = await _run(main.get_client_credential)
+    try:
+        config = await _run(main.OIDC.config)
+        token_res = await _http.post(config['token_endpoint'], data={
+            'code': request.args['code'],
+            'client_id': cred['ID'],
+            'client_secret': cred['secret'],
+            'redirect_uri': main.OIDC_REDIRECT_URI,
+            'grant_type': 'authorization_code'
+        })
+        if token_res.is_error:
+            try:
+                body = token_res.json()
+            except ValueError:
+                body = None
+            if oidc.rejects_client(token_res.status_code, body):
+                raise oidc.InvalidClient(token_res.text)
+        token_res.raise_for_status()
+        token_res = token_res.json()
+        claims = await _run(main.OIDC.verify_id_token, token_res['id_token'], cred['ID'], nonce)
+    except oidc.InvalidClient:
+        # The credential may have been rotated, read it again on the next login.
+        main._credential.pop('oidc')
+        return 'Login failed.', 401
+    except (oidc.InvalidToken, oidc.requests.RequestException, httpx.HTTPError, KeyError, ValueError):
+        return 'Login failed.', 401
+    user_id = await _run(main._verify_user, claims['sub'], claims['email'])
+    if not user_id:
+        user_id = await _run(main._add_user, claims['sub'], claims['email'])
+    session = await _run(main._create_session, user_id, token_res['access_token'], token_res.get('expires_in', 3600))
+    res = await make_response(await render_template('index.html'))
+    res.set_cookie('session', session)
+    res.delete_cookie(main.OIDC_COOKIE)
+    return res
+
+
+@app.route('/events')
+async def send_events():
+    """Send the events of current user like main.send_events.
+
+    :return: All entities in database in json form.
+    """
+    parent_id = await _current_user()
+    if not parent_id:
+        return 'Session expired.', 401
+    try:
+        limit, cursor, days = main._parse_page_args(request.args)
+        etag, payload = await _run(main._events_response, parent_id, limit, cursor, days, request.if_none_match)
+    except ValueError as e:
+        return str(e), 400
+    res = await make_response('', 304) if payload is None else await make_response(payload)
+    res.set_etag(etag)
+    res.headers['Cache-Control'] = 'no-cache'
+    return res
+
+
+@app.route('/events/stream')
+async def stream_events():
+    """Push events to the client through Server-Sent Events like main.stream_events.
+
+    :return: A streaming response of events in json form.
+    """
+    if not main.EVENT_STREAM:
+        return '', 204
+    token = request.cookies.get('session')
+    parent_id = await _current_user()
+    if not parent_id:
+        return 'Session expired.', 401
+    try:
+        limit, _, days = main._parse_page_args(request.args)
+    except ValueError as e:
+        return str(e), 400
+    stream = main._EventStream(parent_id, token, limit, days)
+
+    async def generate():
+        main._streams_open.inc()
+        try:
+            yield (await _run(stream.start)).encode('utf-8')
+            more = True
+            while more:
+                current = await _wait_events(parent_id, stream.version, stream.timeout())
+                message, more = await _run(stream.step, current)
+                if message:
+                    yield message.encode('utf-8')
+        finally:
+            main._streams_open.dec()
+
+    encoding = compression.choose(request.accept_encodings)
+    body = generate() if encoding is None else compression.compressed_async(generate(), compression.Stream(encoding))
+    res = await make_response(body, 200, {
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    compression.negotiated(res, encoding)
+    res.timeout = None
+    return res
+
+
+@app.route('/event', methods=['POST'])
+async def add_event():
+    """Insert the event into database.
+    If the event doesn't have year, insert the next occurrence of a matching date.
+
+    :return: Status Information.
+    """
+    parent_id = await _current_user()
+    if not parent_id:
+        return 'Session expired.', 401
+    try:
+        event = main._parse_event(json.loads(await request.get_data()))
+    except ValueError as e:
+        return str(e), 400
+    new_ID = await _run(main._add_event, event, parent_id)
+    return json.dumps({'text': 'Success! The unique ID of the new event is ' + str(new_ID)})
+
+
+@app.route('/events:batch', methods=['POST'])
+async def add_events():
+    """Insert a list of events into database with a single write.
+    Each event is checked like in add_event, invalid ones are reported and skipped.
+
+    :return: The unique ID or the error of each event, in the order of the request.
+    """
+    parent_id = await _current_user()
+    if not parent_id:
+        return 'Session expired.', 401
+    try:
+        items = main._parse_batch(await request.get_data())
+    except ValueError as e:
+        return str(e), 400
+    return json.dumps({'results': await _run(main._add_results, items, parent_id)})
+
+
+@app.route('/events:batch', methods=['DELETE'])
+async def del_events():
+    """Delete a list of events according to their unique IDs with a single write.
+
+    :return: The result of each ID, in the order of the request.
+    """
+    parent_id = await _current_user()
+    if not parent_id:
+        return 'Session expired.', 401
+    try:
+        items = main._parse_batch(await request.get_data())
+    except ValueError as e:
+        return str(e), 400
+    return json.dumps({'results': await _run(main._del_results, items, parent_id)})
+
+
+@app.route('/event/<event_id>', methods=['DELETE'])
+async def del_event(event_id):
+    """Delete an event according to the unique ID generated by datastore.
+
+    :param event_id: The unique ID of target event.
+    :return: Status Information.
+    """
+    parent_id = await _current_user()
+    if not parent_id:
+        return 'Session expired.', 401
+    await _run(main._del_event, event_id, parent_id)
+    return json.dumps({'text': 'Success! Target event has been deleted!'})
+
+
+@app.route('/logout', methods=['DELETE'])
+async def logout():
+    """Delete the session in database and log out.
+
+    @return: Redirect address.
+    """
+    await _run(main._del_session, request.cookies.get('session'))
+    return json.dumps({'text': '/login'})
+
+
+@app.route('/tasks/reap')
+async def reap():
+    """Delete past events and expired sessions, move recurring events to their next occurrence.
+    Requested by App Engine cron.
+
+    :return: The number of deleted entities of each kind.
+    """
+    if request.headers.get('X-Appengine-Cron') != 'true':
+        return 'Forbidden', 403
+    return json.dumps(await _run(main._reap_all))
+
+
+@app.route('/_ah/warmup')
+async def warmup():
+    """Prepare a new instance before App Engine sends it traffic, like main.warmup.
+
+    :return: An empty response.
+    """
+    await _run(main._warm_up)
+    for name in ('index.html', 'login.html'):
+        app.jinja_env.get_template(name)
+    return ''
+
+
+@app.route('/metrics')
+async def metrics_page():
+    """Expose the metrics of this process in the Prometheus text format, like main.metrics_page.
+
+    :return: The metrics.
+    """
+    if not main.METRICS_TOKEN or not hmac.compare_digest(request.headers.get('Authorization', ''),
+                                                         'Bearer ' + main.METRICS_TOKEN):
+        return 'Forbidden', 403
+    return Response(main.METRICS.render(), content_type=metrics.CONTENT_TYPE)
+
+
+if __name__ == '__main__':
+    app.run(host='127.0.0.1', port=8080)
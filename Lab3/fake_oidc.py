@@ -0,0 +1,127 @@
+"""A local fake of the Google OpenID Connect provider, to try the login flow without Google.
+
+It serves the discovery document, its signing keys, an authorization endpoint which signs in immediately
+and a token endpoint which issues RS256 signed ID tokens.
+Any client ID is accepted, and any secret unless --client-secret is given.
+
+    python fake_oidc.py --port 9000
+    OIDC_ISSUER=http://localhost:9000 OIDC_REDIRECT_URI=http://localhost:8080/oidauth python main.py
+
+/rotate switches to a new signing key, to exercise the refresh of unknown keys.
+The keys are generated with the cryptography package and the tokens signed with google-auth.
+"""
+import argparse
+import base64
+import time
+import uuid
+from urllib.parse import urlencode
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from flask import Flask, jsonify, redirect, request
+from google.auth import crypt, jwt
+
+app = Flask(__name__)
+_codes = {}
+_keys = []
+_client_secret = None
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _int2b64(value):
+    return _b64encode(value.to_bytes((value.bit_length() + 7) // 8, 'big'))
+
+
+def new_key(bits=2048):
+    """Generate an RSA signing key.
+
+    @param bits: The size of the modulus.
+    @return: The ID of the key, its signer and its public numbers.
+    """
+    kid = uuid.uuid4().hex
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=bits, backend=default_backend())
+    pem = private_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                    serialization.NoEncryption())
+    return {'kid': kid, 'signer': crypt.RSASigner.from_string(pem, key_id=kid),
+            'public': private_key.public_key().public_numbers()}
+
+
+def sign(claims, key):
+    """Issue an RS256 signed JWT, the kid of the key is in its header."""
+    return jwt.encode(key['signer'], claims).decode('ascii')
+
+
+@app.route('/.well-known/openid-configuration')
+def discovery():
+    base = request.host_url.rstrip('/')
+    return jsonify({
+        'issuer': base,
+        'authorization_endpoint': base + '/auth',
+        'token_endpoint': base + '/token',
+        'jwks_uri': base + '/jwks',
+        'id_token_signing_alg_values_supported': ['RS256']
+    })
+
+
+@app.route('/jwks')
+def jwks():
+    res = jsonify({'keys': [{'kty': 'RSA', 'alg': 'RS256', 'use': 'sig', 'kid': key['kid'],
+                             'n': _int2b64(key['public'].n), 'e': _int2b64(key['public'].e)} for key in _keys]})
+    res.headers['Cache-Control'] = 'public, max-age=3600'
+    return res
+
+
+@app.route('/auth')
+def auth():
+    """Sign in as the user given by login_hint, or a fixed test user."""
+    code = uuid.uuid4().hex
+    user = request.args.get('login_hint', 'tester')
+    _codes[code] = {'client_id': request.args['client_id'], 'nonce': request.args.get('nonce'), 'user': user}
+    return redirect(request.args['redirect_uri'] + '?' + urlencode({'code': code, 'state': request.args['state']}))
+
+
+@app.route('/token', methods=['POST'])
+def token():
+    if _client_secret is not None and request.form.get('client_secret') != _client_secret:
+        return jsonify({'error': 'invalid_client'}), 401
+    grant = _codes.pop(request.form.get('code'), None)
+    if grant is None or grant['client_id'] != request.form.get('client_id'):
+        return jsonify({'error': 'invalid_grant'}), 400
+    now = int(time.time())
+    claims = {
+        'iss': request.host_url.rstrip('/'),
+        'aud': grant['client_id'],
+        'sub': 'fake-' + grant['user'],
+        'email': grant['user'] + '@example.com',
+        'iat': now,
+        'exp': now + 3600
+    }
+    if grant['nonce']:
+        claims['nonce'] = grant['nonce']
+    return jsonify({
+        'access_token': uuid.uuid4().hex,
+        'expires_in': 3600,
+        'token_type': 'Bearer',
+        'id_token': sign(claims, _keys[-1])
+    })
+
+
+@app.route('/rotate', methods=['POST'])
+def rotate():
+    """Sign the next tokens with a new key, the old one stays published."""
+    _keys.append(new_key())
+    return jsonify({'kid': _keys[-1]['kid']})
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run a fake OpenID Connect provider.')
+    parser.add_argument('--port', type=int, default=9000)
+    parser.add_argument('--client-secret', help='the only client secret accepted by the token endpoint')
+    args = parser.parse_args()
+    _client_secret = args.client_secret
+    _keys.append(new_key())
+    app.run(host='127.0.0.1', port=args.port)
@@ -0,0 +1,34 @@
+"""Modules imported on first use.
+
+google.cloud.datastore and requests take hundreds of milliseconds to import, which every cold start paid
+before it could serve its first request, even one which never touches them.
+A LazyModule stands in for a module and imports it when one of its attributes is read.
+"""
+import importlib
+import threading
+
+
+class LazyModule:
+    """A module imported when one of its attributes is first read."""
+
+    def __init__(self, name):
+        """
+        @param name: The absolute name of the module, e.g. google.cloud.datastore.
+        """
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Import the module if it is not imported yet.
+
+        @return: The module.
+        """
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
@@ -1,28 +1,171 @@
-import base64
 import calendar
+import functools
 import hashlib
+import hmac
 import json
 import os
-from datetime import datetime
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlencode
 
-import requests
 from flask import *
-from google.cloud import datastore
+
+import assets
+import compression
+import metrics
+import oidc
+import profiling
+import recurrence
+import tokens
+from cache import EventCache, SingleFlight, TTLCache
+from lazy import LazyModule
+from storage import InstrumentedClient, datastore, get_client
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Imported on first use, see lazy.py.
+api_exceptions = LazyModule('google.api_core.exceptions')
 
 app = Flask(__name__)
-DS = datastore.Client()
-oidc_state = ''
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', compression.MIN_SIZE))
+# Registered first, so it runs after the other after_request hooks.
+compression.install(app, COMPRESS_MIN_SIZE)
+ASSETS = assets.install(app)
+METRICS = metrics.Registry()
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+_request_seconds = METRICS.histogram('http_request_duration_seconds', 'Seconds to respond to a request.',
+                                     ('route', 'method', 'status'))
+_requests_in_flight = METRICS.gauge('http_requests_in_flight', 'Requests being handled.')
+_streams_open = METRICS.gauge('event_streams_open', 'Event streams open.')
+_storage_seconds = METRICS.histogram('storage_operation_duration_seconds',
+                                     'Seconds spent in storage calls, a query is observed once per page.',
+                                     ('op', 'kind'))
+DS = InstrumentedClient(get_client(), lambda op, kind, seconds: _storage_seconds.observe(seconds, op, kind))
+# Requests sending PROFILE_SECRET in the X-Profile header, and a PROFILE_RATE fraction of all requests,
+# are profiled into PROFILE_DIR.
+PROFILER = profiling.install(app, os.environ.get('PROFILE_DIR', '/tmp/profiles'), os.environ.get('PROFILE_SECRET'),
+                             float(os.environ.get('PROFILE_RATE', 0)))
+REAP_BATCH = 500
+TRANSACTION_RETRIES = 5
+# Recurring events which passed are listed at their next occurrence until the reaper advances them.
+# Twice the interval of the reap cron.
+REAP_LAG = 2 * 3600
+PAGE_SIZE = 50
+# A commit holds at most 500 writes, one of them is the version of the events.
+MAX_BATCH_SIZE = 499
+MAX_PAGE_SIZE = 500
+MAX_WINDOW_DAYS = 366
+OIDC = oidc.Provider(os.environ.get('OIDC_ISSUER', 'https://accounts.google.com'))
+OIDC_REDIRECT_URI = os.environ.get('OIDC_REDIRECT_URI', 'https://lab3-291100.ue.r.appspot.com/oidauth')
+# The state and nonce of a login are kept in this cookie until the provider redirects back to /oidauth.
+OIDC_COOKIE = 'oidc'
+OIDC_LOGIN_TTL = 600
+# The client credential is read from OIDC_CLIENT_ID and OIDC_CLIENT_SECRET, or the JSON file at
+# OIDC_CREDENTIALS_FILE, and otherwise from the Datastore. It is kept for CREDENTIAL_TTL seconds.
+CREDENTIAL_TTL = int(os.environ.get('CREDENTIAL_TTL', 3600))
+_credential = TTLCache(maxsize=1)
+STREAM_HEARTBEAT = 30
+# The App Engine standard runtime buffers responses, so a stream never reaches the browser there.
+# With EVENT_STREAM off, /events/stream refuses streams and the page polls /events instead.
+EVENT_STREAM = os.environ.get('EVENT_STREAM', 'on') == 'on'
+# A stream ends after this many seconds and the browser reconnects, so none outlives a request deadline.
+STREAM_LIFETIME = int(os.environ.get('STREAM_LIFETIME', 55))
+_event_changed = threading.Condition()
+_event_versions = {}
+# Functions called with the id of a user and the new version whenever their events change, from any thread.
+_event_listeners = []
+SESSION_CACHE_TTL = 300
+_sessions = TTLCache(maxsize=10000)
+_events = EventCache(max_bytes=int(os.environ.get('EVENT_CACHE_BYTES', 32 * 1024 * 1024)))
+# Concurrent misses of the same session or event list share one read, e.g. the tabs of a user polling together.
+_session_reads = SingleFlight()
+_event_reads = SingleFlight()
+# 'datastore' keeps sessions as entities, 'signed' issues HMAC signed tokens verified in process.
+SESSION_BACKEND = os.environ.get('SESSION_BACKEND', 'datastore')
+SESSION_SECRET = os.environ.get('SESSION_SECRET', '').encode('utf-8')
+# A key of its own on each instance would log users out whenever another instance serves them.
+if SESSION_BACKEND == 'signed' and not SESSION_SECRET:
+    raise ValueError('SESSION_SECRET must be set for the signed session backend.')
+REVOKED_REFRESH = 60
+_revoked = TTLCache(maxsize=100000)
+_revoked_loaded = 0
+_caches = {'sessions': _sessions, 'events': _events, 'revoked': _revoked, 'credential': _credential}
+METRICS.callback('cache_hits_total', 'Cache lookups which hit.', ('cache',), 'counter',
+                 lambda: {(name,): cache.hits for name, cache in _caches.items()})
+METRICS.callback('cache_misses_total', 'Cache lookups which missed.', ('cache',), 'counter',
+                 lambda: {(name,): cache.misses for name, cache in _caches.items()})
+METRICS.callback('cache_hit_ratio', 'Hits over lookups since the process started.', ('cache',), 'gauge',
+                 lambda: {(name,): cache.hits / max(cache.hits + cache.misses, 1) for name, cache in _caches.items()})
+METRICS.callback('cache_entries', 'Entries in the cache.', ('cache',), 'gauge',
+                 lambda: {(name,): len(cache) for name, cache in _caches.items()})
+METRICS.callback('coalesced_reads_total', 'Reads which ran, concurrent identical reads share one.', ('read',),
+                 'counter', lambda: {('sessions',): _session_reads.calls, ('events',): _event_reads.calls})
+METRICS.callback('coalesced_reads_saved_total', 'Reads saved by waiting for an identical read in flight.', ('read',),
+                 'counter', lambda: {('sessions',): _session_reads.saved, ('events',): _event_reads.saved})
+
+
+def _load_client_credential():
+    """Read the OAuth credential from its source.
+
+    @return: Client ID and Client secret of credential.
+    """
+    if os.environ.get('OIDC_CLIENT_ID') and os.environ.get('OIDC_CLIENT_SECRET'):
+        return {'ID': os.environ['OIDC_CLIENT_ID'], 'secret': os.environ['OIDC_CLIENT_SECRET']}
+    path = os.environ.get('OIDC_CREDENTIALS_FILE')
+    if path:
+        with open(path) as f:
+            data = json.load(f)
+        # The client secret file downloaded from the Google console nests the credential under 'web'.
+        data = data.get('web', data)
+        return {'ID': data['client_id'], 'secret': data['client_secret']}
+    entity = DS.get(DS.key('secret', 'oidc'))
+    return {'ID': entity['client_ID'], 'secret': entity['client_secret']}
+
+
+def get_client_credential(reload=False):
+    """Get OAuth credential.
 
+    @param reload: Read the credential from its source even if it is cached.
+    @return: Client ID and Client secret of credential.
+    """
+    credential = None if reload else _credential.get('oidc')
+    if credential is None:
+        credential = _load_client_credential()
+        _credential.set('oidc', credential, time.time() + CREDENTIAL_TTL)
+    return credential
 
-def get_client_credential():
-    """Get OAuth credential.
 
-    Returns:Client ID and Client secret of credential.
+def _utc(date):
+    """Attach UTC to a naive date, like the database does when it is stored."""
+    if date.tzinfo is None:
+        return date.replace(tzinfo=timezone.utc)
+    return date
 
+
+def _event_entity(event, parent_id):
+    """Build the entity of a new event.
+    A recurring event also keeps its rule and its first occurrence, its date is the next occurrence.
+
+    @param event: The event parsed by _parse_event.
+    @param parent_id: The id of current user.
+    @return: The entity.
     """
-    ID = DS.get(DS.key('secret', 'oidc'))['client_ID']
-    secret = DS.get(DS.key('secret', 'oidc'))['client_secret']
-    return {'ID': ID, 'secret': secret}
+    entity = datastore.Entity(key=DS.key('Lab3-event', parent=DS.key('Lab3-user', parent_id)),
+                              exclude_from_indexes=('date_str', 'repeat', 'start'))
+    entity.update({
+        'name': event['name'],
+        'date': event['date'],
+        'date_str': event['date'].strftime("%m/%d/%Y")
+    })
+    if event.get('repeat'):
+        entity['repeat'] = event['repeat']
+        entity['start'] = event['start']
+    return entity
 
 
 def _add_event(event, parent_id):
@@ -32,12 +175,18 @@ def _add_event(event, parent_id):
     @param parent_id: The id of current user.
     @return: The unique ID of the new event.
     """
-    entity = datastore.Entity(key=DS.key('Lab2-event', parent=DS.key('Lab2-user', parent_id)))
-    entity.update({
-        'name': event['name'],
-        'date': event['date']
-    })
-    DS.put(entity)
+    entity = _event_entity(event, parent_id)
+    version = _bump_version(parent_id, puts=[entity])
+    date = _utc(entity['date'])
+    if date >= datetime.now(timezone.utc):
+        added = dict(entity)
+        added['date'] = date
+        added['ID'] = entity.id
+        if 'start' in added:
+            added['start'] = _utc(added['start'])
+        _events.update(parent_id, version, added=added)
+    else:
+        _events.update(parent_id, version)
     return entity.id
 
 
@@ -47,61 +196,714 @@ def _del_event(ID, parent_ID):
     @param ID: The unique id of target event
     @param parent_ID: The id of current user.
     """
-    key = DS.key('Lab2-user', int(parent_ID), 'Lab2-event', int(ID))
-    DS.delete(key)
+    key = DS.key('Lab3-user', int(parent_ID), 'Lab3-event', int(ID))
+    version = _bump_version(int(parent_ID), deletes=[key])
+    _events.update(int(parent_ID), version, deleted=int(ID))
 
 
-def get_all(parent_id):
-    """Getting all events stored in the database.
-    Automatically delete past events.
+def _add_events(events, parent_id):
+    """Adding a list of events to the database with put_multi.
+
+    @param events: The events need to be added to the database.
+    @param parent_id: The id of current user.
+    @return: The unique IDs of the new events.
+    """
+    entities = [_event_entity(event, parent_id) for event in events]
+    if entities:
+        _bump_version(parent_id, puts=entities)
+        _events.pop(parent_id)
+    return [entity.id for entity in entities]
+
+
+def _del_events(IDs, parent_ID):
+    """Delete a list of events according to their unique IDs with delete_multi.
+    The keys are looked up with get_multi first, IDs of events which do not exist are not deleted.
+
+    @param IDs: The unique ids of target events.
+    @param parent_ID: The id of current user.
+    @return: The set of the IDs which were deleted.
+    """
+    keys = [DS.key('Lab3-user', int(parent_ID), 'Lab3-event', int(ID)) for ID in IDs]
+    found = [entity.key for entity in DS.get_multi(keys)] if keys else []
+    if found:
+        _bump_version(int(parent_ID), deletes=found)
+        _events.pop(int(parent_ID))
+    return {key.id for key in found}
+
+
+def _parse_event(data):
+    """Check a new event sent by the client and parse its date.
+    If the event doesn't have year, take the next occurrence of a matching date.
+    A recurring event starts at the date and is dated at its next occurrence.
+
+    @param data: The event decoded from the request.
+    @return: The event with name and date, and repeat and start if it is recurring.
+    @raise ValueError: The message of the error if the event is invalid.
+    """
+    if not isinstance(data, dict) or not data.get('name'):
+        raise ValueError('Name cannot be empty!')
+    if not data.get('date'):
+        raise ValueError('Date cannot be empty!')
+    repeat = data.get('repeat') or None
+    if repeat is not None and repeat not in recurrence.RULES:
+        raise ValueError('Repeat must be one of ' + ', '.join(recurrence.RULES) + '!')
+    date = str(data['date']).split('/')
+    for i in range(len(date)):
+        try:
+            date[i] = int(date[i])
+        except ValueError:
+            raise ValueError('Date format is wrong!')
+
+    if len(date) != 2 and len(date) != 3:
+        raise ValueError('Date format is wrong!')
+    start = None
+    cur_time = datetime.now()
+    try:
+        if len(date) == 3:
+            start = datetime(date[0], date[1], date[2])
+        else:
+            for year in range(cur_time.year, cur_time.year + 8):
+                if date[1] > calendar.monthrange(year, date[0])[1]:
+                    continue
+                temp = datetime(year, date[0], date[1])
+                if temp > cur_time:
+                    start = temp
+                    break
+    except ValueError:
+        pass
+    if start is None:
+        raise ValueError('Date does not exist!')
+    if repeat is None:
+        return {'name': data['name'], 'date': start}
+    return {
+        'name': data['name'],
+        'date': recurrence.next_occurrence(start, repeat, cur_time),
+        'repeat': repeat,
+        'start': start
+    }
+
+
+def _parse_batch(data):
+    """Check the body sent to a batch endpoint.
+
+    @param data: The body of the request.
+    @return: The items of the list.
+    @raise ValueError: If the body is not a list or the list is too long.
+    """
+    try:
+        items = json.loads(data)
+    except ValueError:
+        raise ValueError('Body must be a JSON list!')
+    if not isinstance(items, list):
+        raise ValueError('Body must be a JSON list!')
+    if len(items) > MAX_BATCH_SIZE:
+        raise ValueError('At most ' + str(MAX_BATCH_SIZE) + ' items per batch!')
+    return items
+
+
+def _batch_items():
+    """Read the list sent to a batch endpoint.
+
+    @return: The items of the list.
+    """
+    try:
+        return _parse_batch(request.data)
+    except ValueError as e:
+        abort(make_response(str(e), 400))
+
+
+def _add_results(items, parent_id):
+    """Insert the valid events of a batch with a single write. Invalid ones are reported and skipped.
+
+    @param items: The items of the batch.
+    @param parent_id: The id of the user.
+    @return: The unique ID or the error of each event, in the order of the batch.
+    """
+    results = []
+    events = []
+    for item in items:
+        try:
+            events.append(_parse_event(item))
+            results.append(None)
+        except ValueError as e:
+            results.append({'error': str(e)})
+    IDs = iter(_add_events(events, parent_id))
+    for i in range(len(results)):
+        if results[i] is None:
+            results[i] = {'ID': next(IDs)}
+    return results
+
+
+def _del_results(items, parent_id):
+    """Delete the events of a batch of IDs with a single write.
+
+    @param items: The items of the batch.
+    @param parent_id: The id of the user.
+    @return: The result of each ID, in the order of the batch.
+    """
+    results = []
+    IDs = []
+    for ID in items:
+        try:
+            IDs.append(int(ID))
+            results.append(None)
+        except (TypeError, ValueError):
+            results.append({'ID': ID, 'error': 'ID is invalid!'})
+    deleted = _del_events(IDs, parent_id)
+    IDs = iter(IDs)
+    for i in range(len(results)):
+        if results[i] is None:
+            ID = next(IDs)
+            results[i] = {'ID': ID, 'deleted': True} if ID in deleted else {'ID': ID, 'error': 'Event not found!'}
+    return results
+
+
+def _get_version(parent_id):
+    """Get the version of a user's events.
+    It is a single lookup by key, which is cheap and strongly consistent.
+
+    @param parent_id: The id of the user.
+    @return: The current version, 0 if the user never changed an event.
+    """
+    entity = DS.get(DS.key('Lab3-user', parent_id, 'Lab3-version', 'events'))
+    if entity is None:
+        return 0
+    return entity['version']
+
+
+def _run_transaction(func):
+    """Run a function in a transaction, retried when a concurrent write conflicts with it.
+
+    @param func: The function, it reads and writes through DS.
+    @return: The result of the function.
+    """
+    for attempt in range(TRANSACTION_RETRIES):
+        try:
+            with DS.transaction():
+                return func()
+        except (api_exceptions.Conflict, api_exceptions.Aborted):
+            if attempt == TRANSACTION_RETRIES - 1:
+                raise
+            time.sleep(0.05 * 2 ** attempt)
+
+
+def _increment_version(parent_id):
+    """Increase the version of a user's events, in the transaction of the write which changed them.
+
+    @param parent_id: The id of the user.
+    @return: The new version.
+    """
+    key = DS.key('Lab3-user', parent_id, 'Lab3-version', 'events')
+    entity = DS.get(key)
+    if entity is None:
+        entity = datastore.Entity(key=key)
+        entity['version'] = 0
+    entity['version'] += 1
+    DS.put(entity)
+    return entity['version']
+
+
+def _bump_version(parent_id, puts=(), deletes=()):
+    """Increase the version of a user's events, with the write which changed them.
+    The events and the version are in the entity group of the user, so they are written in one transaction
+    and a write is never stored without its version. The transaction is retried when a concurrent write
+    of the user conflicts with it.
+
+    @param parent_id: The id of the user.
+    @param puts: The event entities to store.
+    @param deletes: The keys of the events to delete.
+    @return: The new version.
+    """
+    def write():
+        if puts:
+            DS.put_multi(puts)
+        if deletes:
+            DS.delete_multi(deletes)
+        return _increment_version(parent_id)
+
+    version = _run_transaction(write)
+    _notify_events(parent_id, version)
+    return version
+
+
+def _notify_events(parent_id, version):
+    """Wake up the event streams of a user whose events have changed.
+
+    @param parent_id: The id of the user.
+    @param version: The new version of the user's events.
+    """
+    with _event_changed:
+        _event_versions[parent_id] = max(_event_versions.get(parent_id, 0), version)
+        _event_changed.notify_all()
+    for listener in _event_listeners:
+        listener(parent_id, version)
+
+
+def _wait_events(parent_id, version, timeout):
+    """Block until the events of a user change in this process or the timeout passes.
+
+    @param parent_id: The id of the user.
+    @param version: The last version seen by the caller.
+    @param timeout: Seconds to wait at most.
+    @return: The latest version known by this process.
+    """
+    with _event_changed:
+        _event_changed.wait_for(lambda: _event_versions.get(parent_id, 0) > version, timeout)
+        return max(_event_versions.get(parent_id, 0), version)
+
+
+def _events_etag(parent_id, version):
+    """Generate the entity tag of a user's event list.
+
+    @param parent_id: The id of the user.
+    @param version: The version of the user's events.
+    @return: The entity tag.
+    """
+    # The hash keeps the Datastore id of the user out of the header.
+    return hashlib.sha256(str(parent_id).encode('utf-8')).hexdigest()[:16] + '-' + str(version)
+
+
+def _events_query(parent_id):
+    """Build the query of upcoming events of a user, ordered by date.
+    It also selects the events which passed since the last reap, see _upcoming and get_page.
 
-    :return events: All events stored in the database.
     @param parent_id: The id of current user.
+    @return: The query.
     """
     ancestor = DS.key('Lab3-user', parent_id)
     query = DS.query(kind='Lab3-event', ancestor=ancestor)
+    query.add_filter('date', '>=', datetime.now() - timedelta(seconds=REAP_LAG))
+    query.order = ['date']
+    return query
 
-    events = query.fetch()
+
+def _upcoming(events):
+    """Take the upcoming events out of the queried ones, sorted by date.
+    Past events are dropped, recurring events which passed are moved to their next occurrence.
+
+    @param events: The events returned by the query.
+    @return: The upcoming events with their IDs.
+    """
+    now = datetime.now(timezone.utc)
     result = []
     for event in events:
         temp = dict(event)
-        if temp['date'].timestamp() < datetime.now().timestamp():
-            DS.delete(event.key)
-            continue
         temp['ID'] = event.id
+        if temp['date'] < now:
+            if not temp.get('repeat'):
+                continue
+            temp['date'] = recurrence.next_occurrence(temp['start'], temp['repeat'], now)
+            temp['date_str'] = None
         result.append(temp)
+    result.sort(key=lambda event: event['date'])
     return result
 
 
+def get_all(parent_id, limit=None):
+    """Getting upcoming events stored in the database, ordered by date.
+    Past events are deleted by the reaper.
+
+    :return events: All events stored in the database.
+    @param parent_id: The id of current user.
+    @param limit: The maximum number of events, no limit if None.
+    """
+    return _upcoming(_events_query(parent_id).fetch(limit=limit))
+
+
+def _fetch_page(parent_id, limit, cursor):
+    """Fetch a page of the query of upcoming events.
+
+    @param parent_id: The id of current user.
+    @param limit: The maximum number of events in the page.
+    @param cursor: The cursor of the page, None for the first page.
+    @return: The entities of the page and the iterator, which holds the cursor of the next page.
+    @raise ValueError: If the cursor is invalid.
+    """
+    iterator = _events_query(parent_id).fetch(limit=limit, start_cursor=cursor)
+    try:
+        return list(next(iterator.pages)), iterator
+    except (ValueError, api_exceptions.BadRequest):
+        raise ValueError('Cursor is invalid!')
+
+
+def _passed_recurring(parent_id, now):
+    """Select the recurring events of a user which passed since the last reap.
+
+    @param parent_id: The id of current user.
+    @param now: The current time.
+    @return: The entities of the events.
+    """
+    query = _events_query(parent_id)
+    query.add_filter('date', '<', now)
+    return [entity for entity in query.fetch() if entity.get('repeat')]
+
+
+def _microseconds(date):
+    return round(date.timestamp() * 1000000)
+
+
+def _split_cursor(cursor):
+    """Split a cursor of get_page into the query cursor and the date bounding the previous pages.
+
+    @param cursor: The cursor, None for the first page.
+    @return: The query cursor and the timestamp in microseconds, both None for the first page.
+    @raise ValueError: If the cursor is invalid.
+    """
+    if cursor is None:
+        return None, None
+    query_cursor, _, bound = cursor.rpartition('.')
+    try:
+        return query_cursor, int(bound)
+    except ValueError:
+        raise ValueError('Cursor is invalid!')
+
+
+def get_page(parent_id, limit, cursor=None):
+    """Getting a page of upcoming events, ordered by date across the pages.
+    Recurring events which passed keep their stored date until the reaper moves them, which sorts them first.
+    Each of them is placed in the page whose stored dates span its next occurrence instead.
+    The cursor carries the last stored date of the previous pages, so every event is in one page.
+
+    @param parent_id: The id of current user.
+    @param limit: The maximum number of events in the page.
+    @param cursor: The cursor returned with the previous page, None for the first page.
+    @return: The events and the cursor of the next page, which is None after the last page.
+    @raise ValueError: If the cursor is invalid.
+    """
+    query_cursor, lower = _split_cursor(cursor)
+    page, iterator = _fetch_page(parent_id, limit, query_cursor)
+    now = datetime.now(timezone.utc)
+    next_cursor = iterator.next_page_token
+    last = not next_cursor or len(page) < limit
+    upper = None if last else _microseconds(page[-1]['date'])
+    if query_cursor is None and (last or page[-1]['date'] >= now):
+        # The first page holds all events which passed.
+        passed = [entity for entity in page if entity['date'] < now and entity.get('repeat')]
+    else:
+        passed = _passed_recurring(parent_id, now)
+    moved = []
+    for entity in passed:
+        date = _microseconds(recurrence.next_occurrence(entity['start'], entity['repeat'], now))
+        if (lower is None or date > lower) and (upper is None or date <= upper):
+            moved.append(entity)
+    result = _upcoming([entity for entity in page if entity['date'] >= now] + moved)
+    if last:
+        return result, None
+    if isinstance(next_cursor, bytes):
+        next_cursor = next_cursor.decode('ascii')
+    return result, next_cursor + '.' + str(upper)
+
+
+def _reap(kind, prop):
+    """Delete the entities of a kind whose time property has passed.
+    Only keys are fetched, and they are deleted in batches.
+
+    @param kind: The kind of entities.
+    @param prop: The name of the time property.
+    @return: The number of deleted entities.
+    """
+    query = DS.query(kind=kind)
+    query.add_filter(prop, '<', datetime.now())
+    query.keys_only()
+    count = 0
+    keys = []
+    for entity in query.fetch():
+        keys.append(entity.key)
+        if len(keys) == REAP_BATCH:
+            DS.delete_multi(keys)
+            count += len(keys)
+            keys = []
+    if keys:
+        DS.delete_multi(keys)
+        count += len(keys)
+    return count
+
+
+def _reap_all():
+    """Delete past events and expired sessions, move recurring events to their next occurrence.
+
+    @return: The number of deleted, or moved, entities of each kind.
+    """
+    deleted, advanced = _reap_events()
+    return {
+        'Lab3-event': deleted,
+        'Lab3-event-advanced': advanced,
+        'Lab3-session': _reap('Lab3-session', 'expire'),
+        'Lab3-revoked': _reap('Lab3-revoked', 'expire')
+    }
+
+
+def _advance_event(key, now):
+    """Move a recurring event which passed to its next occurrence, with a new version of its user's events.
+    The event is read again in a transaction, so an event deleted meanwhile is not written back.
+    The transaction is retried like in _bump_version.
+
+    @param key: The key of the event.
+    @param now: The current time.
+    @return: If the event was moved.
+    """
+    parent_id = key.parent.id
+
+    def move():
+        entity = DS.get(key)
+        if entity is None or entity['date'] >= now:
+            return None
+        entity['date'] = recurrence.next_occurrence(entity['start'], entity['repeat'], now)
+        entity['date_str'] = entity['date'].strftime("%m/%d/%Y")
+        DS.put(entity)
+        return _increment_version(parent_id)
+
+    version = _run_transaction(move)
+    if version is None:
+        return False
+    _notify_events(parent_id, version)
+    return True
+
+
+def _reap_events():
+    """Delete past events and move recurring events which passed to their next occurrence.
+    Past events are deleted in batches, each moved event gets its user a new version in its own transaction.
+    An event still conflicting after the retries is left to the next run.
+
+    @return: The number of deleted events and the number of moved events.
+    """
+    now = datetime.now(timezone.utc)
+    query = DS.query(kind='Lab3-event')
+    query.add_filter('date', '<', now)
+    deleted = 0
+    advanced = 0
+    keys = []
+    for entity in query.fetch():
+        if entity.get('repeat'):
+            try:
+                if _advance_event(entity.key, now):
+                    advanced += 1
+            except (api_exceptions.Conflict, api_exceptions.Aborted):
+                pass
+            continue
+        keys.append(entity.key)
+        if len(keys) == REAP_BATCH:
+            DS.delete_multi(keys)
+            deleted += len(keys)
+            keys = []
+    if keys:
+        DS.delete_multi(keys)
+        deleted += len(keys)
+    return deleted, advanced
+
+
+def _dumps(obj):
+    """Serialize an object to JSON, with orjson if it is installed.
+
+    :param obj: The object.
+    :return: The JSON string.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj).decode('utf-8')
+    return json.dumps(obj)
+
+
+@functools.lru_cache(maxsize=4096)
+def _format_date(date):
+    """Format the date of an event stored before the date string was saved with it."""
+    return date.strftime("%m/%d/%Y")
+
+
 def events2json(events):
     """Transfer event objects into JSON format.
-    Generate string of date and ETA from the date property.
-    Sort events by the ETA.
+    Take the date string saved with the event and generate the ETA from the date property.
+    The clock is read once, so all ETAs of a list are computed against the same time.
+    Keep the timestamp so that the browser can count down by itself.
+    Events are expected to be sorted by date already.
 
     :param events: Event objects need to be transfer.
     :return: Json format events.
     """
-    events.sort(key=lambda event: event['date'])
-
+    current = time.time()
+    result = []
     for event in events:
-        timestamp = datetime.timestamp(event['date'])
-        current = datetime.now().timestamp()
-        event['date'] = event['date'].strftime("%m/%d/%Y")
-        event['ETA'] = ''
+        timestamp = event['date'].timestamp()
         diff = int(timestamp - current)
         if diff < 86400:
-            event['ETA'] = ':' + str(diff % 60) + ' left.'
-            diff = diff // 60
-            event['ETA'] = ':' + str(diff % 60) + event['ETA']
-            diff = diff // 60
-            event['ETA'] = str(diff) + event['ETA']
+            ETA = '%d:%d:%d left.' % (diff // 3600, diff // 60 % 60, diff % 60)
         else:
-            event['ETA'] = str(diff // 86400) + ' days later.'
-    return json.dumps(events)
+            ETA = '%d days later.' % (diff // 86400)
+        result.append({
+            'name': event['name'],
+            'date': event.get('date_str') or _format_date(event['date']),
+            'ID': event['ID'],
+            'timestamp': int(timestamp),
+            'repeat': event.get('repeat'),
+            'ETA': ETA
+        })
+    return _dumps(result)
+
+
+def page2json(events, next_cursor):
+    """Transfer a page of event objects into JSON format.
+
+    :param events: Event objects of the page.
+    :param next_cursor: The cursor of the next page.
+    :return: Json format page with its events and the cursor of the next page.
+    """
+    return '{"events": ' + events2json(events) + ', "next_cursor": ' + _dumps(next_cursor) + '}'
+
+
+def _expand(events, days):
+    """Add the later occurrences of recurring events which fall in the next days.
+    Nothing is written, the occurrences are computed from the rule of each event.
+
+    @param events: Upcoming events, recurring ones at their next occurrence.
+    @param days: The number of days.
+    @return: The events and the added occurrences, sorted by date.
+    """
+    until = datetime.now(timezone.utc) + timedelta(days=days)
+    result = list(events)
+    for event in events:
+        if not event.get('repeat'):
+            continue
+        for date in recurrence.occurrences(event['start'], event['repeat'], event['date'], until):
+            temp = dict(event)
+            temp['date'] = date
+            temp['date_str'] = None
+            result.append(temp)
+    if len(result) > len(events):
+        result.sort(key=lambda event: event['date'])
+    return result
+
+
+def _read_events(key, version):
+    """Read the events selected by a client from the database and cache them.
+
+    @param key: The id of current user, the page size and the cursor.
+    @param version: The current version of the user's events.
+    @return: The events and the cursor of the next page.
+    """
+    parent_id, limit, cursor = key
+    if limit is None and cursor is None:
+        cached = get_all(parent_id), None
+    else:
+        cached = get_page(parent_id, limit or PAGE_SIZE, cursor)
+    _events.set(key, version, *cached)
+    return cached
+
+
+def _events_payload(parent_id, limit, cursor, version, days=None):
+    """Select the events requested by a client in json form.
+    The events are served from the cache if they were read at the current version.
+
+    @param parent_id: The id of current user.
+    @param limit: The page size, all events are sent as a list if both limit and cursor are None.
+    @param cursor: The cursor of the requested page.
+    @param version: The current version of the user's events.
+    @param days: List the occurrences of recurring events in this many days, only the next one if None.
+    @return: Json format events or page.
+    @raise ValueError: If the cursor is invalid.
+    """
+    key = (parent_id, limit, cursor)
+    cached = _events.get(key, version)
+    if cached is None:
+        cached = _event_reads.do(key + (version,), _read_events, key, version)
+    events, next_cursor = cached
+    if days:
+        events = _expand(events, days)
+    if limit is None and cursor is None:
+        return events2json(events)
+    return page2json(events, next_cursor)
+
+
+def _parse_limit(limit):
+    """Check the page size asked by a client.
+
+    @param limit: The limit argument of the request, None if it is not given.
+    @return: The page size, at most MAX_PAGE_SIZE.
+    @raise ValueError: If the limit is not a positive number.
+    """
+    if limit is None:
+        return None
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise ValueError('Limit must be a number!')
+    if limit < 1:
+        raise ValueError('Limit must be positive!')
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def _parse_days(days):
+    """Check the number of days of recurring events asked by a client.
+
+    @param days: The days argument of the request, None if it is not given.
+    @return: The number of days, at most MAX_WINDOW_DAYS.
+    @raise ValueError: If days is not a positive number.
+    """
+    if days is None:
+        return None
+    try:
+        days = int(days)
+    except ValueError:
+        raise ValueError('Days must be a number!')
+    if days < 1:
+        raise ValueError('Days must be positive!')
+    return min(days, MAX_WINDOW_DAYS)
+
+
+def _parse_page_args(args):
+    """Check the pagination arguments of a request, and the days of recurring events to list.
+
+    @param args: The query arguments of the request.
+    @return: The page size, the cursor and the days, None if they are not given.
+    @raise ValueError: If the limit or the days are not positive numbers.
+    """
+    return _parse_limit(args.get('limit')), args.get('cursor'), _parse_days(args.get('days'))
+
+
+def _page_args():
+    """Read the pagination arguments of current request, and the days of recurring events to list.
+
+    @return: The page size, the cursor and the days, None if they are not given.
+    """
+    try:
+        return _parse_page_args(request.args)
+    except ValueError as e:
+        abort(make_response(str(e), 400))
+
+
+def _events_response(parent_id, limit, cursor, days, if_none_match):
+    """Read the events of a user for /events, unless the client already has the current version.
+
+    @param parent_id: The id of the user.
+    @param limit: The page size, None for all events.
+    @param cursor: The cursor of the page, None for the first one.
+    @param days: The days of recurring events to list, None for their next occurrence only.
+    @param if_none_match: The If-None-Match header of the request, parsed.
+    @return: The ETag of the events, and their payload or None if the client has them.
+    @raise ValueError: If the cursor is invalid.
+    """
+    version = _get_version(parent_id)
+    etag = _events_etag(parent_id, version)
+    if if_none_match.contains_weak(etag):
+        return etag, None
+    return etag, _events_payload(parent_id, limit, cursor, version, days)
 
 
 def _search_session(token):
     """Verify a session. Delete the session if it is expired.
+    Active sessions are cached until they expire, at most SESSION_CACHE_TTL seconds.
+
+    @param token: Session token.
+    @return: The id of session owner if the session is still active.
+    """
+    if SESSION_BACKEND == 'signed':
+        return _verify_signed_session(token)
+    parent_id = _sessions.get(token)
+    if parent_id is not None:
+        return parent_id
+    return _session_reads.do(token, _read_session, token)
+
+
+def _read_session(token):
+    """Read a session from the database and cache it if it is active.
 
     @param token: Session token.
     @return: The id of session owner if the session is still active.
@@ -111,6 +913,11 @@ def _search_session(token):
 
     events = query.fetch()
     for event in events:
+        if event['expire'].timestamp() < time.time():
+            _del_session(token)
+            return False
+        expire = min(event['expire'].timestamp(), time.time() + SESSION_CACHE_TTL)
+        _sessions.set(token, event.key.parent.id, expire)
         return event.key.parent.id
     return False
 
@@ -120,6 +927,10 @@ def _del_session(token):
 
     @param token: The token of session.
     """
+    if SESSION_BACKEND == 'signed':
+        _revoke_signed_session(token)
+        return
+    _sessions.pop(token)
     query = DS.query(kind='Lab3-session')
     query.add_filter('token', '=', token)
 
@@ -132,21 +943,76 @@ def _del_session(token):
         DS.delete(key)
 
 
-def _create_session(parent_id, token):
+def _create_session(parent_id, token, expires_in=3600):
     """Create a session token and store it.
 
     @param parent_id: The session owner's ID.
+    @param token: The access token of the session owner.
+    @param expires_in: Seconds until the access token expires.
     @return: The token generated.
     """
+    if SESSION_BACKEND == 'signed':
+        return _create_signed_session(parent_id, time.time() + expires_in)
     entity = datastore.Entity(key=DS.key('Lab3-session', parent=DS.key('Lab3-user', parent_id)))
     entity.update({
         'token': token,
-        'expire': datetime.now()
+        'expire': datetime.now() + timedelta(seconds=expires_in)
     })
     DS.put(entity)
     return entity['token']
 
 
+def _create_signed_session(parent_id, expire):
+    """Create a signed session token. Nothing is stored in the database.
+
+    @param parent_id: The session owner's ID.
+    @param expire: The timestamp when the session expires.
+    @return: The token generated.
+    """
+    return tokens.sign({'uid': parent_id, 'exp': int(expire), 'nonce': uuid.uuid4().hex}, SESSION_SECRET)
+
+
+def _verify_signed_session(token):
+    """Verify a signed session token without reading the database.
+
+    @param token: Session token.
+    @return: The id of session owner if the session is still active.
+    """
+    payload = tokens.verify(token, SESSION_SECRET)
+    if payload is None or payload['exp'] < time.time():
+        return False
+    _load_revoked()
+    if _revoked.get(payload['nonce']) is not None:
+        return False
+    return payload['uid']
+
+
+def _revoke_signed_session(token):
+    """Revoke a signed session token until it expires.
+
+    @param token: Session token.
+    """
+    payload = tokens.verify(token, SESSION_SECRET)
+    if payload is None or payload['exp'] < time.time():
+        return
+    _revoked.set(payload['nonce'], True, payload['exp'])
+    entity = datastore.Entity(key=DS.key('Lab3-revoked', payload['nonce']))
+    entity['expire'] = datetime.utcfromtimestamp(payload['exp'])
+    DS.put(entity)
+
+
+def _load_revoked():
+    """Load the tokens revoked by other instances, at most once every REVOKED_REFRESH seconds."""
+    global _revoked_loaded
+    if time.time() - _revoked_loaded < REVOKED_REFRESH:
+        return
+    _revoked_loaded = time.time()
+    query = DS.query(kind='Lab3-revoked')
+    query.add_filter('expire', '>', datetime.utcnow())
+    for entity in query.fetch():
+        _revoked.set(entity.key.name, True, entity['expire'].timestamp())
+
+
 def _verify_user(uname, passwd):
     """Check if the user name and password matches.
 
@@ -196,6 +1062,105 @@ def _add_user(uname, passwd):
     return entity.id
 
 
+def _warm_up():
+    """Do the work a first request of a new instance would otherwise wait for.
+    Import the Datastore client, create it and open its connection with a read of a key which does not exist.
+    """
+    DS.get(DS.key('Lab3-warmup', 'warmup'))
+    # The discovery document and the client credential are needed by every login.
+    OIDC.config()
+    get_client_credential()
+
+
+class _EventStream:
+    """The messages of an event stream: the full list first, then the list again whenever it changes.
+    The Flask and Quart routes only differ in how they wait for a change between two steps.
+    """
+
+    def __init__(self, parent_id, token, limit, days):
+        """
+        @param parent_id: The id of the user.
+        @param token: The session token, checked again while nothing changes.
+        @param limit: The page size, None for all events.
+        @param days: The days of recurring events to list.
+        """
+        self.parent_id = parent_id
+        self._token = token
+        self._limit = limit
+        self._days = days
+        self._deadline = time.time() + STREAM_LIFETIME
+        self.version = None
+
+    def _message(self):
+        return 'data: ' + _events_payload(self.parent_id, self._limit, None, self.version, self._days) + '\n\n'
+
+    def start(self):
+        """
+        @return: The first message, with the full list.
+        """
+        self.version = _get_version(self.parent_id)
+        return 'retry: 1000\n' + self._message()
+
+    def timeout(self):
+        """
+        @return: Seconds to wait for a change before the next step.
+        """
+        return max(0, min(STREAM_HEARTBEAT, self._deadline - time.time()))
+
+    def step(self, current):
+        """Answer the end of a wait.
+
+        @param current: The latest version known by this process.
+        @return: The next message or None, and whether the stream goes on.
+        """
+        if current == self.version:
+            if time.time() >= self._deadline:
+                return None, False
+            if not _search_session(self._token):
+                return 'event: expired\ndata: /login\n\n', False
+            # Catch changes made by other instances.
+            current = _get_version(self.parent_id)
+        if current == self.version:
+            return ': keep-alive\n\n', True
+        self.version = current
+        return self._message(), True
+
+
+def _count_stream(stream):
+    """Count a streaming response as open until it ends or the client goes away.
+
+    @param stream: The generator of the response.
+    """
+    _streams_open.inc()
+    try:
+        yield from stream
+    finally:
+        _streams_open.dec()
+
+
+@app.before_request
+def _start_request():
+    g.request_start = time.perf_counter()
+    _requests_in_flight.inc()
+
+
+@app.after_request
+def _record_status(res):
+    g.request_status = res.status_code
+    return res
+
+
+@app.teardown_request
+def _observe_request(exc):
+    """Observe the latency of a request, until its response is returned, and whether it failed."""
+    if 'request_start' not in g:
+        return
+    _requests_in_flight.dec()
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    status = g.get('request_status', 500) if exc is None else 500
+    _request_seconds.observe(time.perf_counter() - g.request_start, route, request.method, str(status))
+
+
 @app.route('/')
 def root():
     """Redirect user to login page or main page.
@@ -220,62 +1185,92 @@ def login_page():
     return make_response(render_template('login.html'))
 
 
+def _new_login():
+    """Generate the state and nonce of a login.
+
+    @return: The state, the nonce and the value of the login cookie keeping them.
+    """
+    state = hashlib.sha256(os.urandom(1024)).hexdigest()
+    nonce = hashlib.sha256(os.urandom(1024)).hexdigest()
+    return state, nonce, state + '.' + nonce
+
+
+def _login_nonce(cookie, state):
+    """Check the state the provider redirected back with against the login cookie.
+
+    @param cookie: The value of the login cookie.
+    @param state: The state of the redirect.
+    @return: The nonce of the login, None if the state does not match.
+    """
+    if not cookie or not state or '.' not in cookie:
+        return None
+    expected, nonce = cookie.split('.', 1)
+    if not hmac.compare_digest(expected, state):
+        return None
+    return nonce
+
+
 @app.route('/login_google')
 def google_login():
+    """Generate the URL of the Google login page.
+    A new state and nonce are kept in the login cookie.
+
+    @return: The URL of the authorization endpoint.
+    """
     client_credential = get_client_credential()
-    global oidc_state
-    oidc_state = hashlib.sha256(os.urandom(1024)).hexdigest()
-    # res = redirect('https://accounts.google.com/o/oauth2/v2/auth?'
-    #                'response_type=code&'
-    #                'client_id=' + client_credential['ID'] +
-    #                '&scope=openid%20email&'
-    #                'redirect_uri=https%3A//lab3-291100.ue.r.appspot.com/oidauth&'
-    #                'state=' + token +
-    #                '&nonce=1234', code=302)
-    # return res
-
-    return 'https://accounts.google.com/o/oauth2/v2/auth?' \
-           'response_type=code&' \
-           'client_id=' + client_credential['ID'] + \
-           '&scope=openid%20email&' \
-           'redirect_uri=https://lab3-291100.ue.r.appspot.com/oidauth&' \
-           'state=' + oidc_state + \
-           '&nonce=1234'
+    state, nonce, cookie = _new_login()
+    res = make_response(OIDC.config()['authorization_endpoint'] + '?' + urlencode({
+        'response_type': 'code',
+        'client_id': client_credential['ID'],
+        'scope': 'openid email',
+        'redirect_uri': OIDC_REDIRECT_URI,
+        'state': state,
+        'nonce': nonce
+    }))
+    res.set_cookie(OIDC_COOKIE, cookie, max_age=OIDC_LOGIN_TTL, httponly=True, secure=request.is_secure)
+    return res
 
 
 @app.route('/oidauth')
 def main_page():
+    """Check the state against the login cookie, exchange the authorization code,
+    verify the ID token and its nonce and create a session of the user.
+
+    @return: The main page.
+    """
+    nonce = _login_nonce(request.cookies.get(OIDC_COOKIE), request.args.get('state'))
+    if nonce is None:
+        abort(make_response('Login failed.', 401))
     code = request.args['code']
-    state = request.args['state']
     cred = get_client_credential()
-    para = {
-        'code': code,
-        'client_id': cred['ID'],
-        'client_secret': cred['secret'],
-        'redirect_uri': 'https://lab3-291100.ue.r.appspot.com/oidauth',
-        'grant_type': 'authorization_code'
-    }
-    token_res = requests.post('https://www.googleapis.com/oauth2/v4/token', para).json()
+    try:
+        token_res = OIDC.exchange_code(code, cred['ID'], cred['secret'], OIDC_REDIRECT_URI)
+        claims = OIDC.verify_id_token(token_res['id_token'], cred['ID'], nonce)
+    except oidc.InvalidClient:
+        # The credential may have been rotated, read it again on the next login.
+        _credential.pop('oidc')
+        abort(make_response('Login failed.', 401))
+    except (oidc.InvalidToken, oidc.requests.RequestException, KeyError):
+        abort(make_response('Login failed.', 401))
     token = token_res['access_token']
-    id_token = token_res['id_token']
-    _, body, _ = id_token.split('.')
-    body += '=' * (-len(body) % 4)
-    claims = json.loads(base64.urlsafe_b64decode(body.encode('utf-8')))
     sub = claims['sub']
     email = claims['email']
     user_id = _verify_user(sub, email)
     if not user_id:
         user_id = _add_user(sub, email)
-    _create_session(user_id, token)
+    session = _create_session(user_id, token, token_res.get('expires_in', 3600))
     res = make_response(render_template('index.html'))
-    res.set_cookie('session', token)
+    res.set_cookie('session', session)
+    res.delete_cookie(OIDC_COOKIE)
     return res
 
 
 @app.route('/events')
 def send_events():
     """Select all events in database.
-    Send them to the client.
+    Send them to the client, a page at a time if limit or cursor is given.
+    Answer 304 without querying the events if the client already has the current version.
+    The ETA in a cached list gets stale, clients should count down from the timestamp.
 
     :return: All entities in database in json form.
     """
@@ -283,9 +1278,47 @@ def send_events():
     parent_id = _search_session(token)
     if not parent_id:
         abort(make_response('Session expired.', 401))
-    else:
-        events = events2json(get_all(parent_id))
-    return events
+    limit, cursor, days = _page_args()
+    try:
+        etag, payload = _events_response(parent_id, limit, cursor, days, request.if_none_match)
+    except ValueError as e:
+        abort(make_response(str(e), 400))
+    res = make_response('', 304) if payload is None else make_response(payload)
+    res.set_etag(etag)
+    res.headers['Cache-Control'] = 'no-cache'
+    return res
+
+
+@app.route('/events/stream')
+def stream_events():
+    """Push events to the client through Server-Sent Events.
+    Send the full list once, then send it again whenever an event of current user is added or deleted.
+    Only the first page is sent if a limit is given.
+
+    :return: A streaming response of events in json form.
+    """
+    if not EVENT_STREAM:
+        # EventSource does not reconnect after a 204, the page falls back to polling.
+        return '', 204
+    token = request.cookies.get('session')
+    parent_id = _search_session(token)
+    if not parent_id:
+        abort(make_response('Session expired.', 401))
+    limit, _, days = _page_args()
+    stream = _EventStream(parent_id, token, limit, days)
+
+    def generate():
+        yield stream.start()
+        more = True
+        while more:
+            message, more = stream.step(_wait_events(parent_id, stream.version, stream.timeout()))
+            if message:
+                yield message
+
+    res = Response(_count_stream(generate()), mimetype='text/event-stream')
+    res.headers['Cache-Control'] = 'no-cache'
+    res.headers['X-Accel-Buffering'] = 'no'
+    return res
 
 
 @app.route('/event', methods=['POST'])
@@ -295,50 +1328,44 @@ def add_event():
 
     :return: Status Information.
     """
-    new_ID = ''
     token = request.cookies.get('session')
     parent_id = _search_session(token)
     if not parent_id:
         abort(make_response('Session expired.', 401))
-    else:
-        event = json.loads(request.data)
-        if not event['name']:
-            abort(make_response('Name cannot be empty!', 400))
-        if not event['date']:
-            abort(make_response('Date cannot be empty!', 400))
-        date = event['date'].split('/')
-        for i in range(len(date)):
-            try:
-                date[i] = int(date[i])
-            except ValueError:
-                abort(make_response('Date format is wrong!', 400))
+    try:
+        event = _parse_event(json.loads(request.data))
+    except ValueError as e:
+        abort(make_response(str(e), 400))
+    new_ID = _add_event(event, parent_id)
 
-        if len(date) != 2 and len(date) != 3:
-            abort(make_response('Date format is wrong!', 400))
-        if len(date) == 3:
-            event['date'] = datetime(date[0], date[1], date[2])
-        if len(date) == 2:
-            result = None
-            cur_time = datetime.now()
-            for year in range(cur_time.year, cur_time.year + 8):
-                if date[1] not in calendar.monthrange(year, date[0]):
-                    continue
-                temp = datetime(year, date[0], date[1])
-                if temp > cur_time:
-                    result = temp
-                    break
-            if not result:
-                abort(make_response('Date does not exist!'))
-            event['date'] = result
-
-        token = request.cookies.get('session')
-        parent_id = _search_session(token)
-        if not parent_id:
-            abort(make_response('Session expired.', 401))
-        else:
-            new_ID = _add_event(event, parent_id)
+    return json.dumps({'text': 'Success! The unique ID of the new event is ' + str(new_ID)})
 
-        return json.dumps({'text': 'Success! The unique ID of the new event is ' + str(new_ID)})
+
+@app.route('/events:batch', methods=['POST'])
+def add_events():
+    """Insert a list of events into database with a single write.
+    Each event is checked like in add_event, invalid ones are reported and skipped.
+
+    :return: The unique ID or the error of each event, in the order of the request.
+    """
+    token = request.cookies.get('session')
+    parent_id = _search_session(token)
+    if not parent_id:
+        abort(make_response('Session expired.', 401))
+    return json.dumps({'results': _add_results(_batch_items(), parent_id)})
+
+
+@app.route('/events:batch', methods=['DELETE'])
+def del_events():
+    """Delete a list of events according to their unique IDs with a single write.
+
+    :return: The result of each ID, in the order of the request.
+    """
+    token = request.cookies.get('session')
+    parent_id = _search_session(token)
+    if not parent_id:
+        abort(make_response('Session expired.', 401))
+    return json.dumps({'results': _del_results(_batch_items(), parent_id)})
 
 
 @app.route('/event/<event_id>', methods=['DELETE'])
@@ -369,7 +1396,43 @@ def logout():
     return json.dumps({'text': '/login'})
 
 
+@app.route('/tasks/reap')
+def reap():
+    """Delete past events and expired sessions, move recurring events to their next occurrence.
+    Requested by App Engine cron.
+
+    :return: The number of deleted entities of each kind.
+    """
+    if request.headers.get('X-Appengine-Cron') != 'true':
+        abort(403)
+    return json.dumps(_reap_all())
+
+
+@app.route('/_ah/warmup')
+def warmup():
+    """Prepare a new instance before App Engine sends it traffic.
+    Requested by App Engine when warmup is in the inbound services.
+
+    :return: An empty response.
+    """
+    _warm_up()
+    for name in ('index.html', 'login.html'):
+        app.jinja_env.get_template(name)
+    return ''
+
+
+@app.route('/metrics')
+def metrics_page():
+    """Expose the metrics of this instance in the Prometheus text format.
+    METRICS_TOKEN must be sent as a bearer token, the metrics are not exposed if it is not set.
+
+    :return: The metrics.
+    """
+    if not METRICS_TOKEN or not hmac.compare_digest(request.headers.get('Authorization', ''),
+                                                    'Bearer ' + METRICS_TOKEN):
+        abort(403)
+    return Response(METRICS.render(), content_type=metrics.CONTENT_TYPE)
+
+
 if __name__ == '__main__':
-    # jsonurl = requests.get('https://accounts.google.com/.well-known/openid-configuration')
-    # Disc_Doc = json.loads(jsonurl.text)
     app.run(host='127.0.0.1', port=8080, debug=True)
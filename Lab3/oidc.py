@@ -0,0 +1,206 @@
+"""OpenID Connect client of the Google login.
+
+All outbound calls share one pooled HTTP session with timeouts.
+The discovery document and the signing keys (JWKS) of the provider are cached for their max-age,
+and the keys are fetched again when a token is signed by a key that is not cached yet.
+ID tokens are verified locally against the cached keys with google-auth.
+"""
+import base64
+import re
+import threading
+import time
+
+from lazy import LazyModule
+
+# Imported with the first outbound call, the login pages are served without them.
+requests = LazyModule('requests')
+jwt = LazyModule('google.auth.jwt')
+
+TIMEOUT = (3.05, 10)
+DISCOVERY_TTL = 24 * 3600
+JWKS_TTL = 3600
+JWKS_MIN_REFRESH = 60
+LEEWAY = 60
+
+
+class InvalidToken(ValueError):
+    """The ID token is malformed, not signed by the provider or its claims do not match."""
+
+
+class InvalidClient(Exception):
+    """The token endpoint rejected the client credential, which may have been rotated."""
+
+
+def rejects_client(status, body):
+    """Check if a response of the token endpoint rejects the client credential rather than the code.
+
+    @param status: The HTTP status of the response.
+    @param body: The decoded JSON body of the response, None if it is not JSON.
+    @return: True if the client is rejected.
+    """
+    return status == 401 or isinstance(body, dict) and body.get('error') == 'invalid_client'
+
+
+def new_session(pool_size=32):
+    """Create a pooled HTTP session.
+    Idempotent requests are retried on connection errors and server errors.
+
+    @param pool_size: The maximum number of connections kept per host.
+    @return: The session.
+    """
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size,
+                          max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=(500, 502, 503, 504)))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def _max_age(res, default):
+    """Read how long a response may be cached from its Cache-Control header."""
+    match = re.search(r'max-age=(\d+)', res.headers.get('Cache-Control', ''))
+    if match:
+        return int(match.group(1))
+    return default
+
+
+def _pem(jwk):
+    """Encode an RSA public key in JWK form as PEM, the form google-auth verifies signatures with.
+
+    @param jwk: The RSA public key in JWK form.
+    @return: The PKCS #1 PEM of the key.
+    """
+    from pyasn1.codec.der import encoder
+    from pyasn1_modules import rfc2437
+
+    key = rfc2437.RSAPublicKey()
+    key['modulus'] = int.from_bytes(_b64decode(jwk['n']), 'big')
+    key['publicExponent'] = int.from_bytes(_b64decode(jwk['e']), 'big')
+    der = base64.encodebytes(encoder.encode(key)).decode('ascii')
+    return '-----BEGIN RSA PUBLIC KEY-----\n' + der + '-----END RSA PUBLIC KEY-----\n'
+
+
+class Provider:
+    """An OpenID Connect provider with its discovery document and keys cached."""
+
+    def __init__(self, issuer, session=None):
+        """
+        @param issuer: The issuer URL, the discovery document is under it.
+        @param session: The HTTP session, a new pooled session is created on the first call if None.
+        """
+        self.issuer = issuer.rstrip('/')
+        self._session = session
+        self._lock = threading.RLock()
+        self._config = None
+        self._config_expire = 0
+        self._keys = {}
+        self._keys_expire = 0
+        self._keys_loaded = 0
+
+    def _http(self):
+        if self._session is None:
+            with self._lock:
+                if self._session is None:
+                    self._session = new_session()
+        return self._session
+
+    def config(self):
+        """Get the discovery document.
+
+        @return: The discovery document.
+        """
+        with self._lock:
+            if self._config is None or time.time() >= self._config_expire:
+                res = self._http().get(self.issuer + '/.well-known/openid-configuration', timeout=TIMEOUT)
+                res.raise_for_status()
+                self._config = res.json()
+                self._config_expire = time.time() + _max_age(res, DISCOVERY_TTL)
+            return self._config
+
+    def _load_keys(self):
+        res = self._http().get(self.config()['jwks_uri'], timeout=TIMEOUT)
+        res.raise_for_status()
+        self._keys = {key['kid']: _pem(key) for key in res.json()['keys'] if key.get('kty') == 'RSA'}
+        self._keys_loaded = time.time()
+        self._keys_expire = self._keys_loaded + _max_age(res, JWKS_TTL)
+
+    def key(self, kid):
+        """Get a signing key of the provider.
+        The keys are reloaded when they expire, or when the key is unknown and they were not loaded in the last minute.
+
+        @param kid: The ID of the key.
+        @return: The public key in PEM form, None if the provider does not have it.
+        """
+        with self._lock:
+            expired = time.time() >= self._keys_expire
+            if expired or (kid not in self._keys and time.time() - self._keys_loaded >= JWKS_MIN_REFRESH):
+                self._load_keys()
+            return self._keys.get(kid)
+
+    def exchange_code(self, code, client_id, client_secret, redirect_uri):
+        """Exchange an authorization code for tokens.
+
+        @param code: The authorization code.
+        @param client_id: The OAuth client ID.
+        @param client_secret: The OAuth client secret.
+        @param redirect_uri: The redirect URI the code was sent to.
+        @return: The token response.
+        @raise InvalidClient: If the client credential is rejected.
+        """
+        res = self._http().post(self.config()['token_endpoint'], data={
+            'code': code,
+            'client_id': client_id,
+            'client_secret': client_secret,
+            'redirect_uri': redirect_uri,
+            'grant_type': 'authorization_code'
+        }, timeout=TIMEOUT)
+        if not res.ok:
+            try:
+                body = res.json()
+            except ValueError:
+                body = None
+            if rejects_client(res.status_code, body):
+                raise InvalidClient(res.text)
+        res.raise_for_status()
+        return res.json()
+
+    def verify_id_token(self, id_token, audience, nonce=None):
+        """Verify the signature and claims of an ID token.
+
+        @param id_token: The ID token.
+        @param audience: The client ID the token must be issued to.
+        @param nonce: The nonce sent with the authorization request, not checked if None.
+        @return: The claims of the token.
+        @raise InvalidToken: If the token is not valid.
+        """
+        try:
+            header = jwt.decode_header(id_token)
+        except (AttributeError, TypeError, ValueError):
+            raise InvalidToken('Malformed token.')
+        if header.get('alg') != 'RS256':
+            raise InvalidToken('Unsupported algorithm.')
+        kid = header.get('kid')
+        key = self.key(kid)
+        if key is None:
+            raise InvalidToken('Unknown signing key.')
+        try:
+            # Checks the signature, and exp and iat within the leeway.
+            claims = jwt.decode(id_token, certs={kid: key}, clock_skew_in_seconds=LEEWAY)
+        except ValueError as e:
+            raise InvalidToken(str(e))
+        if claims.get('iss') not in (self.issuer, self.issuer.split('://', 1)[-1]):
+            raise InvalidToken('Invalid issuer.')
+        # google-auth rejects an aud holding a list, which OpenID Connect allows.
+        aud = claims.get('aud')
+        if aud != audience and not (isinstance(aud, list) and audience in aud):
+            raise InvalidToken('Invalid audience.')
+        if nonce is not None and claims.get('nonce') != nonce:
+            raise InvalidToken('Invalid nonce.')
+        return claims
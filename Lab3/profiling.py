@@ -0,0 +1,127 @@
+"""Profile single requests of the app with cProfile.
+
+A request is profiled when it sends the secret in the X-Profile header, or when it is picked by the sampling rate.
+Its profile is written to the profile directory as <route>.<method>.<milliseconds>ms.<time>.prof,
+one request at a time, since a thread can only run one profiler.
+Streaming responses are profiled until the handler returns the stream.
+
+Summarize the hotspots of the collected profiles:
+
+    python profiling.py /tmp/profiles --route events --top 20
+"""
+import argparse
+import cProfile
+import glob
+import hmac
+import os
+import random
+import re
+import threading
+import time
+
+from flask import g, request
+
+HEADER = 'X-Profile'
+
+
+class Profiler:
+    """Run selected requests of a Flask app under cProfile."""
+
+    def __init__(self, directory, secret=None, rate=0.0):
+        """
+        @param directory: The directory the profiles are written to.
+        @param secret: The value of the X-Profile header which asks for a profile, no header is accepted if None.
+        @param rate: The fraction of requests profiled without asking.
+        """
+        self.directory = directory
+        self.secret = secret
+        self.rate = rate
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.secret) or self.rate > 0
+
+    def _selected(self):
+        header = request.headers.get(HEADER)
+        if header and self.secret and hmac.compare_digest(header.encode('utf-8'), self.secret.encode('utf-8')):
+            return True
+        return self.rate > 0 and random.random() < self.rate
+
+    def start(self):
+        """Start profiling the current request if it is selected and no other request is profiled."""
+        if not self._selected() or not self._lock.acquire(blocking=False):
+            return
+        g.profile = cProfile.Profile()
+        g.profile_start = time.perf_counter()
+        g.profile.enable()
+
+    def stop(self, exc=None):
+        """Stop profiling the current request and write its profile."""
+        profile = g.pop('profile', None)
+        if profile is None:
+            return
+        try:
+            profile.disable()
+            elapsed = (time.perf_counter() - g.profile_start) * 1000
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            name = '%s.%s.%dms.%d.prof' % (re.sub(r'\W+', '_', route).strip('_') or 'root', request.method,
+                                           elapsed, time.time() * 1000)
+            os.makedirs(self.directory, exist_ok=True)
+            profile.dump_stats(os.path.join(self.directory, name))
+        finally:
+            self._lock.release()
+
+
+def install(app, directory, secret=None, rate=0.0):
+    """Profile requests of an app, nothing is installed unless a secret or a rate is given.
+
+    @param app: The Flask app.
+    @param directory: The directory the profiles are written to.
+    @param secret: The value of the X-Profile header which asks for a profile.
+    @param rate: The fraction of requests profiled without asking.
+    @return: The profiler.
+    """
+    profiler = Profiler(directory, secret, rate)
+    if profiler.enabled:
+        app.before_request(profiler.start)
+        app.teardown_request(profiler.stop)
+    return profiler
+
+
+def summarize(directory, route=None, top=20, sort='cumulative'):
+    """Print the slowest profiled requests and the hotspots across them.
+
+    @param directory: The directory of the profiles.
+    @param route: Only summarize the profiles of this route, e.g. events or oidauth.
+    @param top: The number of requests and functions shown.
+    @param sort: The pstats sort key of the functions.
+    """
+    import pstats
+
+    files = glob.glob(os.path.join(directory, (route or '*') + '.*.prof'))
+    if not files:
+        print('No profiles in ' + directory)
+        return
+    requests = []
+    for path in files:
+        match = re.match(r'(.+)\.([A-Z]+)\.(\d+)ms\.\d+\.prof$', os.path.basename(path))
+        if match:
+            requests.append((int(match.group(3)), match.group(1), match.group(2), path))
+    requests.sort(reverse=True)
+    print('%d profiles, the slowest:' % len(files))
+    for elapsed, name, method, path in requests[:top]:
+        print('%8d ms  %-6s %-20s %s' % (elapsed, method, name, os.path.basename(path)))
+    print()
+    stats = pstats.Stats(*files)
+    stats.strip_dirs().sort_stats(sort).print_stats(top)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Summarize the profiles of requests.')
+    parser.add_argument('directory', nargs='?', default=os.environ.get('PROFILE_DIR', '/tmp/profiles'))
+    parser.add_argument('--route', help='only the profiles of this route, as in the file names')
+    parser.add_argument('--top', type=int, default=20)
+    parser.add_argument('--sort', default='cumulative', help='pstats sort key, e.g. cumulative or tottime')
+    args = parser.parse_args()
+    summarize(args.directory, args.route, args.top, args.sort)
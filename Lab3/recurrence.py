@@ -0,0 +1,69 @@
+"""Recurrence rules of events.
+
+A recurring event is stored once with the date of its first occurrence as start.
+Occurrences are computed from the start, so a monthly event on the 31st falls on the last day of shorter months
+and comes back to the 31st after them.
+"""
+import calendar
+from datetime import timedelta
+
+RULES = ('yearly', 'monthly', 'weekly')
+_MONTHS = {'yearly': 12, 'monthly': 1}
+
+
+def _add_months(date, months):
+    year, month = divmod(date.month - 1 + months, 12)
+    year += date.year
+    month += 1
+    return date.replace(year=year, month=month, day=min(date.day, calendar.monthrange(year, month)[1]))
+
+
+def occurrence(start, rule, n):
+    """Compute an occurrence of a rule.
+
+    @param start: The first occurrence.
+    @param rule: One of RULES.
+    @param n: The number of the occurrence, 0 for the first one.
+    @return: The date of the occurrence.
+    """
+    if rule == 'weekly':
+        return start + timedelta(weeks=n)
+    return _add_months(start, _MONTHS[rule] * n)
+
+
+def next_occurrence(start, rule, after):
+    """Find the first occurrence of a rule later than a date.
+
+    @param start: The first occurrence.
+    @param rule: One of RULES.
+    @param after: The date.
+    @return: The date of the occurrence.
+    """
+    if start > after:
+        return start
+    if rule == 'weekly':
+        n = (after - start) // timedelta(weeks=1)
+    else:
+        n = ((after.year - start.year) * 12 + after.month - start.month) // _MONTHS[rule]
+    date = occurrence(start, rule, n)
+    while date <= after:
+        n += 1
+        date = occurrence(start, rule, n)
+    return date
+
+
+def occurrences(start, rule, after, until):
+    """List the occurrences of a rule later than a date, up to another date.
+
+    @param start: The first occurrence.
+    @param rule: One of RULES.
+    @param after: The date the occurrences are later than.
+    @param until: The last date an occurrence may fall on.
+    @return: The dates of the occurrences, in order.
+    """
+    result = []
+    date = next_occurrence(start, rule, after)
+    while date <= until:
+        result.append(date)
+        date = next_occurrence(start, rule, date)
+    return result
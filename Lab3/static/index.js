@@ -1,18 +1,37 @@
 'use strict';
 
+const PAGE_SIZE = 50;
+// The largest page the server sends, refreshes keep at most this many loaded events.
+const MAX_PAGE_SIZE = 500;
+
 let events = [];
+let nextCursor = null;
+// Refreshes ask for every page loaded with 'More', so they are not dropped.
+let limit = PAGE_SIZE;
+let source = null;
+let shown = [];
+let failure = null;
+let poller = null;
+let etag = null;
+// When the list was last fetched again for a recurring event which passed, in seconds.
+let refreshed = 0;
 
-let clock = self.setInterval(getEvents, 1000)
+document.addEventListener('DOMContentLoaded', () => {
+    streamEvents();
+    self.setInterval(showEvents, 1000);
+});
 
-function reqJSON(method, url, data) {
+function reqJSON(method, url, data, headers = {}) {
     return new Promise((resolve, reject) => {
         let xhr = new XMLHttpRequest();
         xhr.open(method, url);
         xhr.responseType = 'json'
         xhr.setRequestHeader("Content-type", "application/json");
+        for (let name in headers)
+            xhr.setRequestHeader(name, headers[name]);
         xhr.onload = () => {
-            if (xhr.status >= 200 && xhr.status < 300) {
-                resolve({status: xhr.status, data: xhr.response});
+            if (xhr.status >= 200 && xhr.status < 300 || xhr.status === 304) {
+                resolve({status: xhr.status, data: xhr.response, etag: xhr.getResponseHeader('ETag')});
             } else {
                 reject({status: xhr.status, data: xhr.response});
             }
@@ -24,31 +43,135 @@ function reqJSON(method, url, data) {
     });
 }
 
+function streamEvents() {
+    if (!self.EventSource) {
+        pollEvents();
+        return;
+    }
+    let stream = new EventSource('/events/stream?limit=' + limit);
+    source = stream;
+    // Some proxies buffer the whole stream, fall back to polling if nothing arrives.
+    let fallback = self.setTimeout(() => {
+        stream.close();
+        // A stream replaced by loadMore is not a reason to poll.
+        if (source === stream)
+            pollEvents();
+    }, 5000);
+    stream.onmessage = (message) => {
+        self.clearTimeout(fallback);
+        let page = JSON.parse(message.data);
+        events = page.events;
+        nextCursor = page.next_cursor;
+        failure = null;
+        showEvents();
+    };
+    stream.addEventListener('expired', (message) => {
+        stream.close();
+        window.location = message.data;
+    });
+    stream.onerror = () => {
+        // A closed source means the server refused the stream, let polling report why.
+        if (stream.readyState === EventSource.CLOSED && source === stream) {
+            self.clearTimeout(fallback);
+            pollEvents();
+        }
+    };
+}
+
+function pollEvents() {
+    if (poller !== null)
+        return;
+    getEvents();
+    poller = self.setInterval(getEvents, 1000);
+}
+
 function getEvents() {
-    reqJSON('GET', '/events')
+    reqJSON('GET', '/events?limit=' + limit, null, etag === null ? {} : {'If-None-Match': etag})
+        .then(({status, data, etag: tag}) => {
+            etag = tag;
+            if (status === 200) {
+                events = data.events;
+                nextCursor = data.next_cursor;
+            }
+            failure = null;
+            showEvents();
+        })
+        .catch(({status, data}) => {
+            if (status === 401)
+                window.location = '/login';
+            // Display an error.
+            failure = 'ERROR: ' + JSON.stringify(data);
+            showEvents();
+        });
+}
+
+function loadMore() {
+    reqJSON('GET', '/events?limit=' + PAGE_SIZE + '&cursor=' + encodeURIComponent(nextCursor))
         .then(({status, data}) => {
-            events = data
-            let html = '<table><tr><th>ID</th><th>Name</th><th>Date</th><th>ETA</th></tr>';
-            let ID = 1;
-            for (let event of data) {
-                html += '<tr><th>' + ID + '</th><th>' + event.name + '</th><th>' + event.date + '</th><th>' + event.ETA + '</th></tr>';
-                ID = ID + 1;
+            events = events.concat(data.events);
+            nextCursor = data.next_cursor;
+            limit = Math.min(limit + PAGE_SIZE, MAX_PAGE_SIZE);
+            // An open stream keeps sending its first limit, open it again with the new one.
+            if (source !== null && source.readyState !== EventSource.CLOSED) {
+                source.close();
+                streamEvents();
             }
-            html += '</table>'
-            document.getElementById('events').innerHTML = html;
+            showEvents();
         })
         .catch(({status, data}) => {
             if (status === 401)
                 window.location = '/login';
             // Display an error.
-            document.getElementById('events').innerHTML = 'ERROR: ' + JSON.stringify(data);
+            alert('ERROR: ' + JSON.stringify(data));
         });
 }
 
+function refreshPassed(now) {
+    // A recurring event which passed keeps its version until the reaper moves it,
+    // so neither the stream nor a conditional poll brings its next occurrence. Fetch the list again.
+    if (now - refreshed < 5 || !events.some(event => event.repeat && event.timestamp <= now))
+        return;
+    refreshed = now;
+    etag = null;
+    getEvents();
+}
+
+function formatETA(timestamp, now) {
+    let diff = Math.floor(timestamp - now);
+    if (diff >= 86400)
+        return Math.floor(diff / 86400) + ' days later.';
+    let ETA = ':' + (diff % 60) + ' left.';
+    diff = Math.floor(diff / 60);
+    ETA = ':' + (diff % 60) + ETA;
+    diff = Math.floor(diff / 60);
+    return diff + ETA;
+}
+
+function showEvents() {
+    if (failure !== null) {
+        document.getElementById('events').innerHTML = failure;
+        return;
+    }
+    let now = Date.now() / 1000;
+    refreshPassed(now);
+    shown = events.filter(event => event.timestamp > now);
+    let html = '<table><tr><th>ID</th><th>Name</th><th>Date</th><th>ETA</th></tr>';
+    let ID = 1;
+    for (let event of shown) {
+        html += '<tr><th>' + ID + '</th><th>' + event.name + '</th><th>' + event.date + (event.repeat ? ' (' + event.repeat + ')' : '') + '</th><th>' + formatETA(event.timestamp, now) + '</th></tr>';
+        ID = ID + 1;
+    }
+    html += '</table>'
+    if (nextCursor !== null)
+        html += '<button type="button" onclick="loadMore()">More</button>';
+    document.getElementById('events').innerHTML = html;
+}
+
 function add_event() {
     let name = prompt('Please enter the name of the new event:');
     let date = prompt('Please enter the date(UTC) of the new event:', 'YYYY/MM/DD');
-    reqJSON('POST', '/event', JSON.stringify({name: name, date: date})).then(({status, data}) => {
+    let repeat = prompt('Please enter how the event repeats (yearly, monthly or weekly), or leave it empty:', '');
+    reqJSON('POST', '/event', JSON.stringify({name: name, date: date, repeat: repeat})).then(({status, data}) => {
         alert(data.text);
     })
         .catch(({status, data}) => {
@@ -61,7 +184,7 @@ function add_event() {
 
 function del_event() {
     let ID = prompt('Please enter the ID of target event:');
-    let uID = events[parseInt(ID) - 1].ID;
+    let uID = shown[parseInt(ID) - 1].ID;
     reqJSON('DELETE', '/event/' + uID).then(({status, data}) => {
         alert(data.text);
     })
@@ -82,6 +205,3 @@ function log_out() {
             alert('ERROR: ' + JSON.stringify(data));
         });
 }
-
-// document.addEventListener('DOMContentLoaded', getEvents);
-  
\ No newline at end of file
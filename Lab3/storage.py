@@ -0,0 +1,426 @@
+"""Storage backends of the app.
+
+The app talks to storage through the subset of the Datastore client API it uses:
+key, get, get_multi, put, put_multi, delete, delete_multi, query and transaction.
+STORAGE_BACKEND selects the implementation:
+
+    datastore   Google Cloud Datastore (default).
+    memory      A process-local stand-in with ancestor scoping, property filters, ordering and cursors,
+                to run, load test and profile the app without a live Datastore.
+
+The client is created on its first call, not when the app is imported, see LazyClient.
+InstrumentedClient wraps either client and reports every storage call to an observer.
+"""
+import base64
+import itertools
+import operator
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from lazy import LazyModule
+
+datastore = LazyModule('google.cloud.datastore')
+
+_OPERATORS = {
+    '=': operator.eq,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+    '!=': operator.ne,
+}
+
+
+def _create_client(backend):
+    if backend == 'memory':
+        return MemoryClient()
+    return datastore.Client()
+
+
+def get_client():
+    """Get the storage client selected by STORAGE_BACKEND, it is created on its first call.
+
+    @return: The storage client.
+    """
+    backend = os.environ.get('STORAGE_BACKEND', 'datastore')
+    if backend not in ('memory', 'datastore'):
+        raise ValueError('Unknown storage backend: ' + backend)
+    return LazyClient(_create_client, backend)
+
+
+class LazyClient:
+    """Create a client when one of its attributes is first read.
+    Creating the Datastore client imports google.cloud.datastore and looks up the credentials,
+    which would otherwise delay every cold start, including the ones serving only static pages.
+    """
+
+    def __init__(self, factory, *args):
+        """
+        @param factory: The function creating the client.
+        @param args: The arguments of the function.
+        """
+        self._factory = factory
+        self._args = args
+        self._client = None
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Create the client if it is not created yet.
+
+        @return: The client.
+        """
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    self._client = self._factory(*self._args)
+        return self._client
+
+    def __getattr__(self, name):
+        return getattr(self.load(), name)
+
+
+def _normalize(value):
+    """Store datetimes the way Datastore does, naive ones are taken as UTC."""
+    if isinstance(value, datetime) and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _key_order(key):
+    """Sort keys like Datastore, IDs before names along the path."""
+    result = []
+    for kind, id_or_name in zip(key.flat_path[::2], key.flat_path[1::2]):
+        result.append((kind, isinstance(id_or_name, str), id_or_name))
+    return result
+
+
+class MemoryClient:
+    """An in-memory stand-in of the Datastore client.
+    Transactions are serialized and their writes are applied when they commit.
+    """
+
+    def __init__(self, project='local'):
+        self.project = project
+        self._entities = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.RLock()
+        self._local = threading.local()
+
+    def key(self, *path, **kwargs):
+        kwargs.setdefault('project', self.project)
+        return datastore.Key(*path, **kwargs)
+
+    def _load(self, key, properties):
+        entity = datastore.Entity(key=key)
+        entity.update(properties)
+        return entity
+
+    def get(self, key, **kwargs):
+        with self._lock:
+            properties = self._entities.get(key.flat_path)
+            if properties is None:
+                return None
+            return self._load(key, properties)
+
+    def get_multi(self, keys, **kwargs):
+        result = []
+        for key in keys:
+            entity = self.get(key)
+            if entity is not None:
+                result.append(entity)
+        return result
+
+    def put(self, entity):
+        with self._lock:
+            if entity.key.is_partial:
+                entity.key = entity.key.completed_key(next(self._ids))
+            properties = {name: _normalize(value) for name, value in entity.items()}
+            self._write(lambda path=entity.key.flat_path: self._entities.__setitem__(path, properties))
+
+    def put_multi(self, entities):
+        for entity in entities:
+            self.put(entity)
+
+    def delete(self, key):
+        with self._lock:
+            self._write(lambda path=key.flat_path: self._entities.pop(path, None))
+
+    def delete_multi(self, keys):
+        for key in keys:
+            self.delete(key)
+
+    def allocate_ids(self, incomplete_key, num_ids):
+        with self._lock:
+            return [incomplete_key.completed_key(next(self._ids)) for _ in range(num_ids)]
+
+    def _write(self, apply):
+        batch = getattr(self._local, 'batch', None)
+        if batch is None:
+            apply()
+        else:
+            batch.append(apply)
+
+    def transaction(self, **kwargs):
+        return MemoryTransaction(self)
+
+    def query(self, kind=None, ancestor=None, filters=(), order=(), **kwargs):
+        return MemoryQuery(self, kind, ancestor, filters, order)
+
+    def _run(self, query):
+        """Select the entities matching a query, in query order."""
+        with self._lock:
+            items = list(self._entities.items())
+        results = []
+        for path, properties in items:
+            if query.kind is not None and path[-2] != query.kind:
+                continue
+            if query.ancestor is not None:
+                ancestor = query.ancestor.flat_path
+                if len(path) <= len(ancestor) or path[:len(ancestor)] != ancestor:
+                    continue
+            if all(self._match(properties, *item) for item in query.filters) \
+                    and all(name.lstrip('-') in properties for name in query.order):
+                results.append(self._load(self.key(*path), properties))
+        results.sort(key=lambda entity: _key_order(entity.key))
+        for name in reversed(query.order):
+            prop = name.lstrip('-')
+            results.sort(key=lambda entity: entity[prop], reverse=name.startswith('-'))
+        return results
+
+    @staticmethod
+    def _match(properties, name, op, value):
+        if name not in properties:
+            return False
+        try:
+            return _OPERATORS[op](properties[name], _normalize(value))
+        except TypeError:
+            return False
+
+
+class MemoryTransaction:
+    """Buffer the writes of current thread and apply them together on commit."""
+
+    def __init__(self, client):
+        self._client = client
+
+    def __enter__(self):
+        self._client._lock.acquire()
+        self._client._local.batch = []
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        batch = self._client._local.batch
+        self._client._local.batch = None
+        try:
+            if exc_type is None:
+                for apply in batch:
+                    apply()
+        finally:
+            self._client._lock.release()
+        return False
+
+
+class MemoryQuery:
+    """The query API of the Datastore client, run against a MemoryClient."""
+
+    def __init__(self, client, kind, ancestor, filters, order):
+        self._client = client
+        self.kind = kind
+        self.ancestor = ancestor
+        self.filters = list(filters)
+        self._order = list(order)
+        self._keys_only = False
+
+    @property
+    def order(self):
+        return self._order
+
+    @order.setter
+    def order(self, value):
+        self._order = [value] if isinstance(value, str) else list(value)
+
+    def add_filter(self, property_name, operator, value):
+        if operator not in _OPERATORS:
+            raise ValueError('Invalid operator: ' + operator)
+        self.filters.append((property_name, operator, value))
+        return self
+
+    def keys_only(self):
+        self._keys_only = True
+
+    def fetch(self, limit=None, offset=0, start_cursor=None, **kwargs):
+        return MemoryIterator(self, limit, offset, start_cursor)
+
+
+class MemoryIterator:
+    """Iterate over query results like the Datastore iterator, with pages and cursors.
+    A cursor is the position in the results, so it is only stable while the matching entities do not change.
+    """
+
+    def __init__(self, query, limit, offset, start_cursor):
+        self._query = query
+        self._limit = limit
+        self._offset = offset
+        self._start_cursor = start_cursor
+        self.next_page_token = None
+
+    @staticmethod
+    def _decode(cursor):
+        if not cursor:
+            return 0
+        if isinstance(cursor, bytes):
+            cursor = cursor.decode('ascii')
+        try:
+            return int(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('ascii'))
+        except (TypeError, ValueError, UnicodeError):
+            raise ValueError('Invalid cursor.')
+
+    @property
+    def pages(self):
+        start = self._decode(self._start_cursor) + self._offset
+        results = self._query._client._run(self._query)
+        end = len(results) if self._limit is None else start + self._limit
+        page = results[start:end]
+        if self._query._keys_only:
+            page = [datastore.Entity(key=entity.key) for entity in page]
+        if end < len(results) or self._limit is not None:
+            self.next_page_token = base64.urlsafe_b64encode(str(min(end, len(results))).encode('ascii'))
+        yield page
+
+    def __iter__(self):
+        for page in self.pages:
+            for entity in page:
+                yield entity
+
+
+def _kind(keys):
+    for key in keys:
+        return key.kind
+    return None
+
+
+class InstrumentedClient:
+    """Wrap a storage client and report every storage call to an observer.
+    The observer is called with the operation (query, get, put, delete, begin, commit or rollback),
+    the kind and the seconds spent. A query is reported once per page of results fetched.
+    The writes of a transaction are only buffered until it commits, so they are not reported,
+    its commit is reported under the kind of its first write.
+    """
+
+    def __init__(self, client, observer):
+        self._client = client
+        self._observer = observer
+        self._local = threading.local()
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def _call(self, op, kind, func, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self._observer(op, kind, time.perf_counter() - start)
+
+    def get(self, key, **kwargs):
+        return self._call('get', key.kind, self._client.get, key, **kwargs)
+
+    def get_multi(self, keys, **kwargs):
+        return self._call('get', _kind(keys), self._client.get_multi, keys, **kwargs)
+
+    def _write(self, op, kind, func, *args):
+        transaction = getattr(self._local, 'transaction', None)
+        if transaction is None:
+            return self._call(op, kind, func, *args)
+        if transaction.kind is None:
+            transaction.kind = kind
+        return func(*args)
+
+    def put(self, entity):
+        return self._write('put', entity.key.kind, self._client.put, entity)
+
+    def put_multi(self, entities):
+        return self._write('put', _kind(entity.key for entity in entities), self._client.put_multi, entities)
+
+    def delete(self, key):
+        return self._write('delete', key.kind, self._client.delete, key)
+
+    def delete_multi(self, keys):
+        return self._write('delete', _kind(keys), self._client.delete_multi, keys)
+
+    def query(self, **kwargs):
+        return InstrumentedQuery(self._client.query(**kwargs), self._observer)
+
+    def transaction(self, **kwargs):
+        return InstrumentedTransaction(self, self._client.transaction(**kwargs))
+
+
+class InstrumentedTransaction:
+    """Wrap a transaction so that its begin and its commit, or rollback, are reported to the observer."""
+
+    def __init__(self, client, transaction):
+        self._client = client
+        self._transaction = transaction
+        # The kind of the first write, set by the client. A transaction without writes has no kind.
+        self.kind = None
+
+    def __getattr__(self, name):
+        return getattr(self._transaction, name)
+
+    def __enter__(self):
+        self._client._call('begin', '', self._transaction.__enter__)
+        self._client._local.transaction = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._client._local.transaction = None
+        op = 'commit' if exc_type is None else 'rollback'
+        return self._client._call(op, self.kind or '', self._transaction.__exit__, exc_type, exc_value, traceback)
+
+
+class InstrumentedQuery:
+    """Wrap a query so that fetching its results is reported to the observer."""
+
+    def __init__(self, query, observer):
+        object.__setattr__(self, '_query', query)
+        object.__setattr__(self, '_observer', observer)
+
+    def __getattr__(self, name):
+        return getattr(self._query, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._query, name, value)
+
+    def fetch(self, *args, **kwargs):
+        return InstrumentedIterator(self._query.fetch(*args, **kwargs), self._query.kind, self._observer)
+
+
+class InstrumentedIterator:
+    """Wrap a query iterator and report the time spent fetching each page."""
+
+    def __init__(self, iterator, kind, observer):
+        self._iterator = iterator
+        self._kind = kind
+        self._observer = observer
+
+    def __getattr__(self, name):
+        return getattr(self._iterator, name)
+
+    @property
+    def pages(self):
+        pages = self._iterator.pages
+        while True:
+            start = time.perf_counter()
+            page = next(pages, None)
+            if page is None:
+                return
+            page = list(page)
+            self._observer('query', self._kind, time.perf_counter() - start)
+            yield page
+
+    def __iter__(self):
+        for page in self.pages:
+            for entity in page:
+                yield entity
@@ -0,0 +1,128 @@
+import asyncio
+import gzip
+import unittest
+import zlib
+
+from flask import Flask, Response, make_response, request
+from werkzeug.datastructures import Accept
+
+import compression
+
+BODY = '{"events": [' + ', '.join('{"name": "event %d", "ID": %d}' % (i, i) for i in range(100)) + ']}'
+GZIP = {'Accept-Encoding': 'gzip'}
+
+
+def create_app():
+    app = Flask(__name__)
+    compression.install(app)
+
+    @app.route('/events')
+    def events():
+        res = make_response(BODY)
+        res.set_etag('v1')
+        if request.if_none_match.contains_weak('v1'):
+            res = make_response('', 304)
+            res.set_etag('v1')
+        return res
+
+    @app.route('/small')
+    def small():
+        return '{"events": []}'
+
+    @app.route('/missing')
+    def missing():
+        return BODY, 404
+
+    @app.route('/stream')
+    def stream():
+        return Response(('data: %d\n\n' % i for i in range(3)), mimetype='text/event-stream')
+
+    return app
+
+
+class CompressTest(unittest.TestCase):
+
+    def test_choose(self):
+        self.assertEqual(compression.choose(Accept([('gzip', 1)])), 'gzip')
+        self.assertIsNone(compression.choose(Accept([('identity', 1)])))
+        self.assertIsNone(compression.choose(Accept([('gzip', 0)])))
+
+    def test_gzip_round_trip(self):
+        data = BODY.encode('utf-8')
+        compressed = compression.compress(data, 'gzip')
+        self.assertLess(len(compressed), len(data))
+        self.assertEqual(gzip.decompress(compressed), data)
+        self.assertEqual(compression.compress(data, 'gzip'), compressed)
+
+    def test_compress_body(self):
+        res = Response(BODY)
+        self.assertIsNone(compression.compress_body(res, b'{}', 'gzip'))
+        self.assertNotIn('Content-Encoding', res.headers)
+        data = compression.compress_body(res, BODY.encode('utf-8'), 'gzip')
+        self.assertEqual(gzip.decompress(data).decode('utf-8'), BODY)
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+
+    def test_compressed_async(self):
+        async def chunks():
+            for i in range(3):
+                yield 'data: %d\n\n' % i
+
+        async def collect():
+            return [chunk async for chunk in compression.compressed_async(chunks(), compression.Stream('gzip'))]
+
+        data = b''.join(asyncio.run(collect()))
+        self.assertEqual(gzip.decompress(data), b'data: 0\n\ndata: 1\n\ndata: 2\n\n')
+
+    def test_stream_chunks_decode_on_arrival(self):
+        stream = compression.Stream('gzip')
+        decompressor = zlib.decompressobj(31)
+        for text in ('data: 1\n\n', 'data: 2\n\n'):
+            self.assertEqual(decompressor.decompress(stream.chunk(text)), text.encode('utf-8'))
+        decompressor.decompress(stream.end())
+        self.assertTrue(decompressor.eof)
+
+
+class InstallTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = create_app().test_client()
+
+    def test_compressed_with_weak_etag(self):
+        res = self.client.get('/events', headers=GZIP)
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(res.headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(res.headers['ETag'], 'W/"v1"')
+        self.assertEqual(gzip.decompress(res.get_data()).decode('utf-8'), BODY)
+
+    def test_identity_when_not_accepted(self):
+        res = self.client.get('/events')
+        self.assertNotIn('Content-Encoding', res.headers)
+        self.assertEqual(res.headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(res.headers['ETag'], '"v1"')
+        self.assertEqual(res.get_data(as_text=True), BODY)
+
+    def test_weak_etag_revalidates(self):
+        etag = self.client.get('/events', headers=GZIP).headers['ETag']
+        res = self.client.get('/events', headers=dict(GZIP, **{'If-None-Match': etag}))
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.headers['ETag'], 'W/"v1"')
+        self.assertEqual(res.headers['Vary'], 'Accept-Encoding')
+
+    def test_small_body_left_as_is(self):
+        res = self.client.get('/small', headers=GZIP)
+        self.assertNotIn('Content-Encoding', res.headers)
+        self.assertEqual(res.headers['Vary'], 'Accept-Encoding')
+
+    def test_error_left_as_is(self):
+        res = self.client.get('/missing', headers=GZIP)
+        self.assertNotIn('Content-Encoding', res.headers)
+
+    def test_stream(self):
+        res = self.client.get('/stream', headers=GZIP)
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(zlib.decompress(res.get_data(), 31).decode('utf-8'),
+                         ''.join('data: %d\n\n' % i for i in range(3)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import threading
+import time
+import unittest
+import uuid
+from urllib.parse import parse_qs, urlencode, urlparse
+
+from werkzeug.serving import make_server
+
+import fake_oidc
+import oidc
+
+AUDIENCE = 'client-id'
+
+
+class VerifyIdTokenTest(unittest.TestCase):
+    """Verify ID tokens issued by fake_oidc, served on a local port."""
+
+    @classmethod
+    def setUpClass(cls):
+        fake_oidc._keys.append(fake_oidc.new_key())
+        cls.server = make_server('127.0.0.1', 0, fake_oidc.app)
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.issuer = 'http://127.0.0.1:%d' % cls.server.server_port
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.thread.join()
+        del fake_oidc._keys[:]
+
+    def setUp(self):
+        self.provider = oidc.Provider(self.issuer)
+        fake_oidc._client_secret = None
+
+    def sign(self, key=None, **claims):
+        now = int(time.time())
+        payload = {'iss': self.issuer, 'aud': AUDIENCE, 'sub': 'fake-tester', 'iat': now, 'exp': now + 3600}
+        payload.update(claims)
+        return fake_oidc.sign(payload, key or fake_oidc._keys[-1])
+
+    def assertInvalid(self, token, audience=AUDIENCE, nonce=None):
+        with self.assertRaises(oidc.InvalidToken):
+            self.provider.verify_id_token(token, audience, nonce)
+
+    def test_valid(self):
+        claims = self.provider.verify_id_token(self.sign(nonce='n'), AUDIENCE, 'n')
+        self.assertEqual(claims['sub'], 'fake-tester')
+
+    def test_audience_list(self):
+        self.provider.verify_id_token(self.sign(aud=['other', AUDIENCE]), AUDIENCE)
+
+    def test_wrong_audience(self):
+        self.assertInvalid(self.sign(), audience='other')
+
+    def test_wrong_issuer(self):
+        self.assertInvalid(self.sign(iss='https://evil.example.com'))
+
+    def test_wrong_nonce(self):
+        self.assertInvalid(self.sign(nonce='n'), nonce='m')
+        self.assertInvalid(self.sign(), nonce='m')
+
+    def test_expired(self):
+        now = int(time.time())
+        self.assertInvalid(self.sign(iat=now - 7200, exp=now - 3600))
+
+    def test_issued_in_future(self):
+        now = int(time.time())
+        self.assertInvalid(self.sign(iat=now + 3600, exp=now + 7200))
+
+    def test_bad_signature(self):
+        header, body, signature = self.sign().split('.')
+        forged = self.sign(sub='fake-admin').split('.')[1]
+        self.assertInvalid(header + '.' + forged + '.' + signature)
+
+    def test_malformed(self):
+        for token in ('', 'abc', 'a.b.c', None):
+            self.assertInvalid(token)
+
+    def test_unpublished_key(self):
+        self.assertInvalid(self.sign(key=fake_oidc.new_key()))
+
+    def test_rotated_key(self):
+        self.provider.verify_id_token(self.sign(), AUDIENCE)
+        fake_oidc._keys.append(fake_oidc.new_key())
+        token = self.sign()
+        # The keys were just loaded, an unknown key does not reload them before JWKS_MIN_REFRESH.
+        self.assertInvalid(token)
+        self.provider._keys_loaded -= oidc.JWKS_MIN_REFRESH
+        self.provider.verify_id_token(token, AUDIENCE)
+
+    def authorize(self, nonce):
+        res = self.provider._http().get(self.provider.config()['authorization_endpoint'] + '?' + urlencode({
+            'client_id': AUDIENCE, 'redirect_uri': 'http://localhost/oidauth', 'state': 's', 'nonce': nonce
+        }), allow_redirects=False)
+        return parse_qs(urlparse(res.headers['Location']).query)['code'][0]
+
+    def test_code_flow(self):
+        nonce = uuid.uuid4().hex
+        token_res = self.provider.exchange_code(self.authorize(nonce), AUDIENCE, 'secret', 'http://localhost/oidauth')
+        claims = self.provider.verify_id_token(token_res['id_token'], AUDIENCE, nonce)
+        self.assertEqual(claims['email'], 'tester@example.com')
+
+    def test_rejected_client(self):
+        fake_oidc._client_secret = 'rotated'
+        with self.assertRaises(oidc.InvalidClient):
+            self.provider.exchange_code(self.authorize('n'), AUDIENCE, 'secret', 'http://localhost/oidauth')
+
+
+if __name__ == '__main__':
+    unittest.main()
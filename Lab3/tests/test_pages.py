@@ -0,0 +1,55 @@
+import os
+import unittest
+from datetime import datetime, timedelta, timezone
+
+os.environ.setdefault('STORAGE_BACKEND', 'memory')
+
+import main
+
+USER = 7
+
+
+class GetPageTest(unittest.TestCase):
+
+    def setUp(self):
+        main.DS.load()._entities.clear()
+        now = datetime.now(timezone.utc)
+        events = [{'name': 'in %d days' % days, 'date': now + timedelta(days=days)} for days in (1, 2, 3, 5, 9, 40)]
+        events += [
+            {'name': 'passed', 'date': now - timedelta(minutes=20)},
+            # Recurring events which passed since the last reap, their next occurrences are in 7 and 6 days.
+            {'name': 'weekly', 'date': now - timedelta(hours=1), 'repeat': 'weekly',
+             'start': now - timedelta(days=7, hours=1)},
+            {'name': 'soon', 'date': now - timedelta(hours=1), 'repeat': 'weekly',
+             'start': now - timedelta(days=1, hours=1)},
+        ]
+        main._add_events(events, USER)
+
+    def read_pages(self, limit):
+        events = []
+        cursor = None
+        while True:
+            page, cursor = main.get_page(USER, limit, cursor)
+            events.extend(page)
+            if cursor is None:
+                return events
+
+    def test_pages_are_ordered_across_pages(self):
+        expected = [event['name'] for event in main.get_all(USER)]
+        self.assertEqual(expected, ['in 1 days', 'in 2 days', 'in 3 days', 'in 5 days', 'soon', 'weekly',
+                                    'in 9 days', 'in 40 days'])
+        for limit in range(1, 10):
+            self.assertEqual([event['name'] for event in self.read_pages(limit)], expected, limit)
+
+    def test_read_does_not_write(self):
+        version = main._get_version(USER)
+        self.read_pages(2)
+        self.assertEqual(main._get_version(USER), version)
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            main.get_page(USER, 2, 'not a cursor')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+os.environ.setdefault('STORAGE_BACKEND', 'memory')
+
+import main
+
+USER = 7
+
+
+class ConflictingTransaction:
+    """A transaction whose commit conflicts with a concurrent write."""
+
+    def __init__(self, transaction):
+        self._transaction = transaction
+
+    def __enter__(self):
+        self._transaction.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._transaction.__exit__(RuntimeError, RuntimeError(), None)
+        raise main.api_exceptions.Conflict('Too much contention.')
+
+
+class ReapEventsTest(unittest.TestCase):
+
+    def setUp(self):
+        main.DS.load()._entities.clear()
+        self.now = datetime.now(timezone.utc)
+        main._add_events([
+            {'name': 'passed', 'date': self.now - timedelta(hours=1)},
+            {'name': 'weekly', 'date': self.now - timedelta(hours=1), 'repeat': 'weekly',
+             'start': self.now - timedelta(days=7, hours=1)},
+            {'name': 'upcoming', 'date': self.now + timedelta(days=1)},
+        ], USER)
+        self.version = main._get_version(USER)
+
+    def conflicts(self, count):
+        """Make the next transactions conflict."""
+        transaction = main.DS.transaction
+        calls = []
+
+        def conflicting(**kwargs):
+            calls.append(1)
+            if len(calls) <= count:
+                return ConflictingTransaction(transaction(**kwargs))
+            return transaction(**kwargs)
+
+        return mock.patch.object(main.DS, 'transaction', conflicting)
+
+    def names(self):
+        return sorted(event['name'] for event in main.DS.query(kind='Lab3-event').fetch())
+
+    def test_reap(self):
+        with mock.patch('time.sleep'):
+            self.assertEqual(main._reap_events(), (1, 1))
+        self.assertEqual(self.names(), ['upcoming', 'weekly'])
+        self.assertEqual(main._get_version(USER), self.version + 1)
+        weekly = [event for event in main.get_all(USER) if event['name'] == 'weekly'][0]
+        self.assertEqual(weekly['date'], self.now - timedelta(hours=1) + timedelta(weeks=1))
+
+    def test_conflict_is_retried(self):
+        with self.conflicts(2), mock.patch('time.sleep'):
+            self.assertEqual(main._reap_events(), (1, 1))
+        self.assertEqual(main._get_version(USER), self.version + 1)
+
+    def test_conflicting_event_is_left_to_next_run(self):
+        with self.conflicts(main.TRANSACTION_RETRIES), mock.patch('time.sleep'):
+            self.assertEqual(main._reap_events(), (1, 0))
+        self.assertEqual(main._get_version(USER), self.version)
+        with mock.patch('time.sleep'):
+            self.assertEqual(main._reap_events(), (0, 1))
+        self.assertEqual(main._get_version(USER), self.version + 1)
+
+    def test_bump_version_retries(self):
+        with self.conflicts(1), mock.patch('time.sleep'):
+            main._add_event({'name': 'new', 'date': self.now + timedelta(days=2)}, USER)
+        self.assertEqual(main._get_version(USER), self.version + 1)
+        self.assertIn('new', self.names())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+from datetime import datetime, timezone
+
+import recurrence
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+class NextOccurrenceTest(unittest.TestCase):
+
+    def test_start_in_future(self):
+        start = utc(2030, 5, 1, 12)
+        for rule in recurrence.RULES:
+            self.assertEqual(recurrence.next_occurrence(start, rule, utc(2030, 4, 1)), start)
+
+    def test_strictly_after(self):
+        start = utc(2030, 1, 7, 9)
+        self.assertEqual(recurrence.next_occurrence(start, 'weekly', start), utc(2030, 1, 14, 9))
+        self.assertEqual(recurrence.next_occurrence(start, 'weekly', utc(2030, 1, 14, 9)), utc(2030, 1, 21, 9))
+        self.assertEqual(recurrence.next_occurrence(start, 'weekly', utc(2030, 1, 14, 8)), utc(2030, 1, 14, 9))
+
+    def test_monthly_clamps_to_month_end(self):
+        start = utc(2021, 1, 31, 18)
+        self.assertEqual(recurrence.next_occurrence(start, 'monthly', utc(2021, 2, 1)), utc(2021, 2, 28, 18))
+        self.assertEqual(recurrence.next_occurrence(start, 'monthly', utc(2024, 2, 1)), utc(2024, 2, 29, 18))
+        self.assertEqual(recurrence.next_occurrence(start, 'monthly', utc(2021, 4, 1)), utc(2021, 4, 30, 18))
+
+    def test_monthly_returns_to_start_day(self):
+        start = utc(2021, 1, 31, 18)
+        self.assertEqual(recurrence.next_occurrence(start, 'monthly', utc(2021, 2, 28, 18)), utc(2021, 3, 31, 18))
+
+    def test_monthly_across_years(self):
+        start = utc(2021, 11, 30)
+        self.assertEqual(recurrence.next_occurrence(start, 'monthly', utc(2022, 1, 15)), utc(2022, 1, 30))
+
+    def test_yearly_leap_day(self):
+        start = utc(2020, 2, 29, 8)
+        self.assertEqual(recurrence.next_occurrence(start, 'yearly', utc(2020, 3, 1)), utc(2021, 2, 28, 8))
+        self.assertEqual(recurrence.next_occurrence(start, 'yearly', utc(2023, 3, 1)), utc(2024, 2, 29, 8))
+
+
+class OccurrencesTest(unittest.TestCase):
+
+    def test_monthly_window(self):
+        start = utc(2021, 1, 31)
+        self.assertEqual(recurrence.occurrences(start, 'monthly', utc(2021, 1, 31), utc(2021, 5, 31)),
+                         [utc(2021, 2, 28), utc(2021, 3, 31), utc(2021, 4, 30), utc(2021, 5, 31)])
+
+    def test_weekly_window(self):
+        start = utc(2030, 1, 7)
+        self.assertEqual(recurrence.occurrences(start, 'weekly', utc(2030, 1, 8), utc(2030, 1, 27)),
+                         [utc(2030, 1, 14), utc(2030, 1, 21)])
+
+    def test_empty_window(self):
+        start = utc(2030, 1, 7)
+        self.assertEqual(recurrence.occurrences(start, 'yearly', utc(2030, 1, 7), utc(2030, 12, 31)), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
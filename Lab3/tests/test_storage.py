@@ -0,0 +1,149 @@
+import os
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+
+import storage
+from storage import InstrumentedClient, MemoryClient, datastore
+
+
+class MemoryClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = MemoryClient()
+        self.parent = self.client.key('user', 'ann')
+        self.now = datetime(2030, 1, 1, tzinfo=timezone.utc)
+        for name, days in (('c', 3), ('a', 1), ('b', 2), ('d', 4), ('e', 5)):
+            self.add(name, days)
+
+    def add(self, name, days, parent=None):
+        entity = datastore.Entity(key=self.client.key('event', parent=parent or self.parent))
+        entity.update({'name': name, 'date': self.now + timedelta(days=days)})
+        self.client.put(entity)
+        return entity
+
+    def query(self, parent=None):
+        query = self.client.query(kind='event', ancestor=parent or self.parent)
+        query.order = ['date']
+        return query
+
+    def test_put_assigns_ids(self):
+        entity = self.add('f', 6)
+        self.assertFalse(entity.key.is_partial)
+        self.assertEqual(self.client.get(entity.key)['name'], 'f')
+
+    def test_get_multi_skips_missing(self):
+        entity = self.add('f', 6)
+        missing = self.client.key('user', 'ann', 'event', 99999)
+        self.assertEqual([e['name'] for e in self.client.get_multi([missing, entity.key])], ['f'])
+
+    def test_delete(self):
+        entity = self.add('f', 6)
+        self.client.delete_multi([entity.key])
+        self.assertIsNone(self.client.get(entity.key))
+
+    def test_ancestor_filter_and_order(self):
+        self.add('other', 0, parent=self.client.key('user', 'bob'))
+        query = self.query()
+        query.add_filter('date', '>=', self.now + timedelta(days=2))
+        self.assertEqual([e['name'] for e in query.fetch()], ['b', 'c', 'd', 'e'])
+        query.order = ['-date']
+        self.assertEqual([e['name'] for e in query.fetch()], ['e', 'd', 'c', 'b'])
+
+    def test_naive_datetimes_are_utc(self):
+        query = self.query()
+        query.add_filter('date', '<', datetime(2030, 1, 2, 12))
+        self.assertEqual([e['name'] for e in query.fetch()], ['a'])
+
+    def test_cursor_pages(self):
+        names = []
+        cursor = None
+        while True:
+            iterator = self.query().fetch(limit=2, start_cursor=cursor)
+            page = list(next(iterator.pages))
+            names.extend(e['name'] for e in page)
+            cursor = iterator.next_page_token
+            if len(page) < 2:
+                break
+        self.assertEqual(names, ['a', 'b', 'c', 'd', 'e'])
+
+    def test_cursor_is_text_or_bytes(self):
+        iterator = self.query().fetch(limit=3)
+        list(next(iterator.pages))
+        cursor = iterator.next_page_token
+        for start in (cursor, cursor.decode('ascii')):
+            page = list(next(self.query().fetch(limit=3, start_cursor=start).pages))
+            self.assertEqual([e['name'] for e in page], ['d', 'e'])
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(ValueError):
+            list(next(self.query().fetch(limit=2, start_cursor='not a cursor').pages))
+
+    def test_keys_only(self):
+        query = self.query()
+        query.keys_only()
+        entities = list(query.fetch())
+        self.assertEqual(len(entities), 5)
+        self.assertTrue(all(not entity for entity in entities))
+
+    def test_transaction_applies_on_commit(self):
+        key = self.client.key('user', 'ann', 'version', 'events')
+        with self.client.transaction():
+            entity = datastore.Entity(key=key)
+            entity['version'] = 1
+            self.client.put(entity)
+            self.assertIsNone(self.client.get(key))
+        self.assertEqual(self.client.get(key)['version'], 1)
+
+    def test_transaction_discarded_on_error(self):
+        key = self.client.key('user', 'ann', 'version', 'events')
+        with self.assertRaises(RuntimeError):
+            with self.client.transaction():
+                self.client.put(datastore.Entity(key=key))
+                raise RuntimeError()
+        self.assertIsNone(self.client.get(key))
+
+
+class ClientTest(unittest.TestCase):
+
+    def test_unknown_backend(self):
+        with mock.patch.dict(os.environ, {'STORAGE_BACKEND': 'sqlite'}):
+            with self.assertRaises(ValueError):
+                storage.get_client()
+
+    def test_lazy_client(self):
+        factory = mock.Mock(return_value=MemoryClient())
+        client = storage.LazyClient(factory, 'memory')
+        factory.assert_not_called()
+        client.key('user', 1)
+        client.key('user', 2)
+        factory.assert_called_once_with('memory')
+
+    def test_instrumented_calls(self):
+        calls = []
+        client = InstrumentedClient(MemoryClient(), lambda op, kind, seconds: calls.append((op, kind)))
+        entity = datastore.Entity(key=client.key('event'))
+        client.put(entity)
+        client.get(entity.key)
+        list(client.query(kind='event').fetch())
+        client.delete(entity.key)
+        self.assertEqual(calls, [('put', 'event'), ('get', 'event'), ('query', 'event'), ('delete', 'event')])
+
+    def test_instrumented_transaction(self):
+        calls = []
+        client = InstrumentedClient(MemoryClient(), lambda op, kind, seconds: calls.append((op, kind)))
+        with client.transaction():
+            client.get(client.key('version', 'events'))
+            client.put_multi([datastore.Entity(key=client.key('event')), datastore.Entity(key=client.key('event'))])
+            client.put(datastore.Entity(key=client.key('version', 'events')))
+        self.assertEqual(calls, [('begin', ''), ('get', 'version'), ('commit', 'event')])
+        with self.assertRaises(RuntimeError):
+            with client.transaction():
+                raise RuntimeError()
+        self.assertEqual(calls[-2:], [('begin', ''), ('rollback', '')])
+        client.delete(client.key('event', 1))
+        self.assertEqual(calls[-1], ('delete', 'event'))
+
+
+if __name__ == '__main__':
+    unittest.main()
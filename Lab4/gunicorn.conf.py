@@ -0,0 +1,26 @@
+"""Gunicorn settings of the production image, all overridable from the environment.
+
+PORT: The port to listen on.
+WEB_CONCURRENCY: The number of worker processes, twice the CPUs plus one by default.
+GUNICORN_THREADS: The number of threads per worker.
+GUNICORN_TIMEOUT: Seconds a request may take before its worker is restarted.
+GUNICORN_GRACEFUL_TIMEOUT: Seconds in-flight requests get to finish after SIGTERM.
+"""
+import multiprocessing
+import os
+
+bind = '0.0.0.0:' + os.environ.get('PORT', '8080')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = 'gthread'
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+# Below the 10 seconds docker stop waits before it kills the container.
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 8))
+keepalive = 5
+# Load the app before forking, so workers share its memory and a broken app fails at start.
+preload_app = True
+# Keep the heartbeat files of workers in memory, /tmp may be a slow overlay filesystem.
+worker_tmp_dir = '/dev/shm'
+accesslog = '-'
+errorlog = '-'
+
@@ -9,5 +9,13 @@ def hello():
     return 'Hello World! This is from Steven Lin.'
 
 
+@app.route('/ready')
+def ready():
+    """Readiness probe, answers once the app is loaded and serving.
+    During a graceful shutdown the workers stop accepting connections, so the probe fails while requests drain.
+    """
+    return 'ready'
+
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=8080, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=8080, debug=True)
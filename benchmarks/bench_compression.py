@@ -0,0 +1,104 @@
+"""Measure the CPU cost and the bandwidth saved by compressing the event lists of a lab.
+
+    python benchmarks/bench_compression.py --lab Lab3 --repeat 50 --output compression.json
+
+For lists of a few sizes, as sent by /events, each codec and level is timed on the same payload,
+best of --repeat runs, and its size is compared with the identity body.
+The stream rows send --updates successive lists over one compressed Server-Sent Events stream,
+each flushed on its own, and report the average bytes per update.
+Brotli rows are only measured if the brotli package is installed.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import zlib
+
+from bench_events2json import ROOT, make_events
+
+SIZES = (5, 20, 50, 200, 500)
+LEVELS = [('gzip', level) for level in (1, 4, 6, 9)] + [('br', quality) for quality in (1, 4, 5, 6, 11)]
+
+
+def best_us(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1e6
+
+
+def codecs(compression):
+    for encoding, level in LEVELS:
+        if encoding == 'br' and compression.brotli is None:
+            continue
+        yield encoding, level
+
+
+def compress(compression, data, encoding, level):
+    if encoding == 'br':
+        return compression.compress(data, 'br', brotli_quality=level)
+    return compression.compress(data, 'gzip', gzip_level=level)
+
+
+def stream_bytes(compression, payloads, encoding, level):
+    """Send payloads as events of one stream, flushed one by one, and return the bytes of each flush."""
+    if encoding == 'br':
+        compressor = compression.brotli.Compressor(mode=compression.brotli.MODE_TEXT, quality=level)
+        flush = lambda data: compressor.process(data) + compressor.flush()
+    else:
+        compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        flush = lambda data: compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    return [len(flush(('data: ' + payload + '\n\n').encode('utf-8'))) for payload in payloads]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the compression of event lists.')
+    parser.add_argument('--lab', choices=['Lab2', 'Lab3'], default='Lab3')
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--updates', type=int, default=20, help='lists sent over the stream')
+    parser.add_argument('--output', help='file to write the results to as JSON')
+    args = parser.parse_args()
+
+    os.environ.setdefault('STORAGE_BACKEND', 'memory')
+    sys.path.insert(0, os.path.join(ROOT, args.lab))
+    import compression
+    import main
+
+    results = {'responses': [], 'stream': []}
+    print('%6s %8s  %-4s %5s %8s %7s %9s %12s' % (
+        'events', 'bytes', 'enc', 'level', 'out', 'ratio', 'us', 'us/KB saved'))
+    for size in SIZES:
+        data = main.events2json(make_events(size)).encode('utf-8')
+        for encoding, level in codecs(compression):
+            out = len(compress(compression, data, encoding, level))
+            us = best_us(lambda: compress(compression, data, encoding, level), args.repeat)
+            saved = (len(data) - out) / 1024
+            row = {'events': size, 'bytes': len(data), 'encoding': encoding, 'level': level, 'compressed': out,
+                   'ratio': out / len(data), 'us': us, 'us_per_kb_saved': us / saved if saved > 0 else None}
+            results['responses'].append(row)
+            print('%6d %8d  %-4s %5d %8d %6.1f%% %9.1f %12s' % (
+                size, len(data), encoding, level, out, row['ratio'] * 100, us,
+                '%.1f' % row['us_per_kb_saved'] if saved > 0 else '-'))
+
+    # Successive lists of a user who adds an event between updates.
+    events = make_events(main.PAGE_SIZE + args.updates)
+    payloads = [main.events2json([dict(event) for event in events[i:i + main.PAGE_SIZE]])
+                for i in range(args.updates)]
+    identity = sum(len(('data: ' + payload + '\n\n').encode('utf-8')) for payload in payloads) / args.updates
+    print()
+    print('stream of %d updates of %d events, %.0f bytes per update uncompressed:' % (
+        args.updates, main.PAGE_SIZE, identity))
+    for encoding, level in codecs(compression):
+        sizes = stream_bytes(compression, payloads, encoding, level)
+        row = {'encoding': encoding, 'level': level, 'first': sizes[0],
+               'per_update': sum(sizes[1:]) / (len(sizes) - 1), 'identity_per_update': identity}
+        results['stream'].append(row)
+        print('  %-4s %2d  first %6d bytes  then %8.1f bytes per update (%.1f%%)' % (
+            encoding, level, row['first'], row['per_update'], row['per_update'] / identity * 100))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'config': vars(args), 'results': results}, f, indent=2)
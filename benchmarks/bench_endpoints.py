@@ -0,0 +1,197 @@
+"""Load test the endpoints of Lab2 or Lab3 against the in-memory storage backend.
+
+Every endpoint is driven through the Flask test client by a pool of threads.
+The latency percentiles, requests per second and storage calls per request are printed and written as JSON,
+so runs before and after a change can be compared:
+
+    python benchmarks/bench_endpoints.py --lab Lab2 --output before.json
+    python benchmarks/bench_endpoints.py --lab Lab2 --output after.json --compare before.json
+
+Lab3 signs users in through Google, so its /login and /signup are skipped and sessions are created directly.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+COOKIES = {'Lab2': 'token', 'Lab3': 'session'}
+_calls = threading.local()
+
+
+def load_app(lab):
+    """Import the app of a lab with the in-memory storage and count its storage calls.
+
+    :param lab: The lab directory, Lab2 or Lab3.
+    :return: The main module of the lab.
+    """
+    os.environ['STORAGE_BACKEND'] = 'memory'
+    sys.path.insert(0, os.path.join(ROOT, lab))
+    import main
+    import storage
+
+    def observe(op, kind, seconds):
+        _calls.count = getattr(_calls, 'count', 0) + 1
+
+    main.DS = storage.InstrumentedClient(main.DS, observe)
+    return main
+
+
+def percentile(values, p):
+    values = sorted(values)
+    if not values:
+        return 0
+    return values[int(round(p / 100 * (len(values) - 1)))]
+
+
+def run(name, requests, concurrency, send):
+    """Send requests concurrently and summarize them.
+
+    :param name: The name of the scenario.
+    :param requests: The arguments of each request.
+    :param concurrency: The number of threads sending requests.
+    :param send: A function sending one request and returning its response.
+    :return: The summary of the scenario.
+    """
+    def measure(args):
+        _calls.count = 0
+        start = time.perf_counter()
+        res = send(*args)
+        latency = time.perf_counter() - start
+        return latency, _calls.count, res.status_code
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        samples = list(pool.map(measure, requests))
+    elapsed = time.perf_counter() - start
+    latencies = [sample[0] * 1000 for sample in samples]
+    statuses = Counter(sample[2] for sample in samples)
+    summary = {
+        'requests': len(samples),
+        'p50_ms': percentile(latencies, 50),
+        'p95_ms': percentile(latencies, 95),
+        'p99_ms': percentile(latencies, 99),
+        'mean_ms': sum(latencies) / len(latencies) if latencies else 0,
+        'rps': len(samples) / elapsed if elapsed else 0,
+        'storage_calls_per_request': sum(sample[1] for sample in samples) / len(samples) if samples else 0,
+        'errors': sum(count for status, count in statuses.items() if status >= 400),
+    }
+    print('%-16s %6d req  p50 %8.2fms  p95 %8.2fms  p99 %8.2fms  %8.1f req/s  %5.2f calls/req  %d errors' % (
+        name, summary['requests'], summary['p50_ms'], summary['p95_ms'], summary['p99_ms'], summary['rps'],
+        summary['storage_calls_per_request'], summary['errors']))
+    return summary
+
+
+def benchmark(lab, users, events, requests, concurrency):
+    """Run every scenario against a lab.
+
+    :return: The summary of each scenario.
+    """
+    main = load_app(lab)
+    cookie = COOKIES[lab]
+    clients = threading.local()
+    results = {}
+
+    def client(token=None):
+        if not hasattr(clients, 'client'):
+            clients.client = main.app.test_client()
+        clients.client.set_cookie(cookie, token or '')
+        return clients.client
+
+    def password(i):
+        return 'passwd-' + str(i)
+
+    # Users and sessions.
+    if lab == 'Lab2':
+        names = ['user-' + str(i) for i in range(users)]
+        results['POST /signup'] = run('POST /signup', [(name, i) for i, name in enumerate(names)], concurrency,
+                                      lambda name, i: client().post('/signup', data=json.dumps(
+                                          {'uname': name, 'passwd': password(i)})))
+        results['POST /login'] = run('POST /login', [(names[i % users], i % users) for i in range(requests)],
+                                     concurrency, lambda name, i: client().post('/login', data=json.dumps(
+                                         {'uname': name, 'passwd': password(i)})))
+        owners = [main._search_user(name, password(i)) for i, name in enumerate(names)]
+        tokens = [main._create_session(owner) for owner in owners]
+    else:
+        owners = [main._add_user('sub-' + str(i), 'user-' + str(i) + '@example.com') for i in range(users)]
+        tokens = [main._create_session(owner, 'token-' + str(i)) for i, owner in enumerate(owners)]
+
+    # Events.
+    random.seed(0)
+    year = time.localtime().tm_year + 1
+    for owner in owners:
+        for _ in range(events):
+            main._add_event({'name': 'event', 'date': main.datetime(year, random.randint(1, 12),
+                                                                     random.randint(1, 28))}, owner)
+
+    def token_of(i):
+        return tokens[i % users]
+
+    results['GET /events'] = run('GET /events', [(i,) for i in range(requests)], concurrency,
+                                 lambda i: client(token_of(i)).get('/events'))
+    etags = [client(token).get('/events').headers.get('ETag') for token in tokens]
+    results['GET /events 304'] = run('GET /events 304', [(i,) for i in range(requests)], concurrency,
+                                     lambda i: client(token_of(i)).get('/events', headers={
+                                         'If-None-Match': etags[i % users]}))
+    created = []
+
+    def add(i):
+        res = client(token_of(i)).post('/event', data=json.dumps(
+            {'name': 'new', 'date': str(year) + '/06/15'}))
+        created.append((i, res.get_json(force=True)['text'].rsplit(' ', 1)[-1]))
+        return res
+
+    results['POST /event'] = run('POST /event', [(i,) for i in range(requests)], concurrency, add)
+    results['DELETE /event'] = run('DELETE /event', created, concurrency,
+                                   lambda i, ID: client(token_of(i)).delete('/event/' + ID))
+    if lab == 'Lab2':
+        logouts = [(main._create_session(owners[i % users]),) for i in range(requests)]
+    else:
+        logouts = [(main._create_session(owners[i % users], 'logout-' + str(i)),) for i in range(requests)]
+    results['DELETE /logout'] = run('DELETE /logout', logouts, concurrency,
+                                    lambda token: client(token).delete('/logout'))
+    return results
+
+
+def compare(results, path):
+    """Print the change of each metric against a previous run."""
+    with open(path) as f:
+        previous = json.load(f)['results']
+    print('\nCompared with ' + path + ':')
+    for name, summary in results.items():
+        if name not in previous:
+            continue
+        before = previous[name]
+        changes = []
+        for metric in ('p50_ms', 'p95_ms', 'p99_ms', 'rps', 'storage_calls_per_request'):
+            if before[metric]:
+                changes.append('%s %+.1f%%' % (metric, (summary[metric] - before[metric]) / before[metric] * 100))
+        print('%-16s %s' % (name, '  '.join(changes)))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the endpoints of a lab.')
+    parser.add_argument('--lab', choices=sorted(COOKIES), default='Lab2')
+    parser.add_argument('--users', type=int, default=20, help='number of users')
+    parser.add_argument('--events', type=int, default=50, help='events per user')
+    parser.add_argument('--requests', type=int, default=500, help='requests per endpoint')
+    parser.add_argument('--concurrency', type=int, default=8, help='concurrent clients')
+    parser.add_argument('--output', help='file to write the results to as JSON')
+    parser.add_argument('--compare', help='results of a previous run to compare with')
+    args = parser.parse_args()
+
+    results = benchmark(args.lab, args.users, args.events, args.requests, args.concurrency)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'lab': args.lab, 'config': {
+                'users': args.users, 'events': args.events, 'requests': args.requests,
+                'concurrency': args.concurrency,
+                'session_backend': os.environ.get('SESSION_BACKEND', 'datastore')
+            }, 'results': results}, f, indent=2)
+    if args.compare:
+        compare(results, args.compare)
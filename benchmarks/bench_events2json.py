@@ -0,0 +1,81 @@
+"""Compare events2json of a lab with the implementation it replaced.
+
+    python benchmarks/bench_events2json.py --lab Lab3 --events 10000 --repeat 20
+
+Events fall on dates like the ones users enter, ten per day.
+Half of them carry the date string saved at write time, the other half are formatted on the fly,
+like events stored before the date string was saved.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def legacy_events2json(events, days):
+    """The original events2json, which reads the clock and formats the date for every event."""
+    events.sort(key=lambda event: event['date'])
+
+    for event in events:
+        timestamp = datetime.timestamp(event['date'])
+        current = datetime.now().timestamp()
+        event['date'] = event['date'].strftime("%m/%d/%Y")
+        event['ETA'] = ''
+        diff = int(timestamp - current)
+        if diff < 86400 or not days:
+            event['ETA'] = ':' + str(diff % 60) + ' left.'
+            diff = diff // 60
+            event['ETA'] = ':' + str(diff % 60) + event['ETA']
+            diff = diff // 60
+            event['ETA'] = str(diff) + event['ETA']
+        else:
+            event['ETA'] = str(diff // 86400) + ' days later.'
+    return json.dumps(events)
+
+
+def make_events(count):
+    start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    events = []
+    for i in range(count):
+        date = start + timedelta(days=i // 10)
+        event = {'name': 'event ' + str(i), 'date': date, 'ID': 5000000000000000 + i}
+        if i % 2:
+            event['date_str'] = date.strftime("%m/%d/%Y")
+        events.append(event)
+    return events
+
+
+def measure(func, events, repeat):
+    """Run func on fresh copies of the events and return the best time in milliseconds."""
+    best = float('inf')
+    for _ in range(repeat):
+        copies = [dict(event) for event in events]
+        start = time.perf_counter()
+        func(copies)
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark events2json.')
+    parser.add_argument('--lab', choices=['Lab2', 'Lab3'], default='Lab3')
+    parser.add_argument('--events', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    os.environ.setdefault('STORAGE_BACKEND', 'memory')
+    sys.path.insert(0, os.path.join(ROOT, args.lab))
+    import main
+
+    events = make_events(args.events)
+    legacy = measure(lambda copies: legacy_events2json(copies, args.lab == 'Lab3'), events, args.repeat)
+    current = measure(main.events2json, events, args.repeat)
+    print('events2json of %d events, best of %d runs (orjson %s):' % (
+        args.events, args.repeat, 'on' if main.orjson is not None else 'off'))
+    print('  legacy  %8.2f ms' % legacy)
+    print('  current %8.2f ms' % current)
+    print('  speedup %8.2fx' % (legacy / current))
@@ -0,0 +1,115 @@
+"""Compare the production image of Lab4 with the development image it replaced.
+
+    python benchmarks/bench_lab4_image.py --runs 5 --requests 5000 --concurrency 32 --output lab4.json
+
+Both images are built from scratch, then for each one:
+the image size is read from docker, the cold start is the time from docker run until /ready answers,
+and the requests per second are measured against / with keep-alive connections.
+The image is built from Lab4/Dockerfile, the old one from Lab4/Dockerfile.dev.
+"""
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+LAB4 = os.path.join(ROOT, 'Lab4')
+IMAGES = {'dev': 'Dockerfile.dev', 'prod': 'Dockerfile'}
+
+
+def docker(*args):
+    return subprocess.run(('docker',) + args, check=True, stdout=subprocess.PIPE,
+                          universal_newlines=True).stdout.strip()
+
+
+def build(name, dockerfile):
+    """Build an image without the layer cache and return its size in bytes."""
+    tag = 'lab4-bench-' + name
+    docker('build', '--no-cache', '-q', '-f', os.path.join(LAB4, dockerfile), '-t', tag, LAB4)
+    return tag, int(docker('image', 'inspect', '-f', '{{.Size}}', tag))
+
+
+def wait_ready(port, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/ready')
+            if conn.getresponse().status == 200:
+                return
+        except (OSError, http.client.HTTPException):
+            pass
+        time.sleep(0.01)
+    raise RuntimeError('The container did not get ready in %d seconds.' % timeout)
+
+
+def start(tag):
+    """Run a container and return its id, its port and the seconds until it was ready."""
+    begin = time.perf_counter()
+    container = docker('run', '-d', '-p', '127.0.0.1::8080', tag)
+    port = int(docker('port', container, '8080').splitlines()[0].rsplit(':', 1)[1])
+    wait_ready(port)
+    return container, port, time.perf_counter() - begin
+
+
+def load(port, requests, concurrency):
+    """Send GET / over keep-alive connections, one per thread, and return the requests per second."""
+    local = threading.local()
+
+    def send(_):
+        if not hasattr(local, 'conn'):
+            local.conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+        local.conn.request('GET', '/')
+        res = local.conn.getresponse()
+        res.read()
+        return res.status
+
+    begin = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        statuses = list(pool.map(send, range(requests)))
+    elapsed = time.perf_counter() - begin
+    return len(statuses) / elapsed, sum(1 for status in statuses if status != 200)
+
+
+def measure(name, dockerfile, runs, requests, concurrency):
+    tag, size = build(name, dockerfile)
+    cold_starts = []
+    for _ in range(runs):
+        container, port, seconds = start(tag)
+        docker('rm', '-f', container)
+        cold_starts.append(seconds)
+    container, port, _ = start(tag)
+    try:
+        load(port, min(requests, 500), concurrency)
+        rps, errors = load(port, requests, concurrency)
+    finally:
+        docker('rm', '-f', container)
+    cold_starts.sort()
+    summary = {
+        'size_mb': size / 1024 / 1024,
+        'cold_start_ms': cold_starts[len(cold_starts) // 2] * 1000,
+        'rps': rps,
+        'errors': errors
+    }
+    print('%-5s %8.1f MB  cold start %8.1f ms  %9.1f req/s  %d errors' % (
+        name, summary['size_mb'], summary['cold_start_ms'], summary['rps'], summary['errors']))
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the Lab4 images.')
+    parser.add_argument('--runs', type=int, default=5, help='cold starts per image, the median is reported')
+    parser.add_argument('--requests', type=int, default=5000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--output', help='file to write the results to as JSON')
+    args = parser.parse_args()
+
+    results = {name: measure(name, dockerfile, args.runs, args.requests, args.concurrency)
+               for name, dockerfile in IMAGES.items()}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'config': vars(args), 'results': results}, f, indent=2)
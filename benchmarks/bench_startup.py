@@ -0,0 +1,76 @@
+"""Measure the cold start of Lab2 or Lab3: the import of main.py and its first response.
+
+    python benchmarks/bench_startup.py --lab Lab3 --runs 10 --output after.json
+    python benchmarks/bench_startup.py --lab Lab3 --runs 10 --compare before.json
+
+Every run starts a new interpreter, like a new App Engine instance, which imports main.py
+and sends its first request through the Flask test client.
+The Datastore client is pointed at an emulator address, so it is created without credentials;
+the request must not reach Datastore, since nothing listens there. GET /login serves a page without storage,
+the first request of a user who is sent to the login page.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = '''
+import json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+res = main.app.test_client().get(sys.argv[1])
+done = time.perf_counter()
+assert res.status_code < 500, res.status_code
+print(json.dumps({'import_ms': (imported - start) * 1000, 'first_response_ms': (done - imported) * 1000,
+                  'modules': len(sys.modules)}))
+'''
+
+
+def start(lab, path):
+    """Import the app of a lab in a new interpreter and send it one request.
+
+    :param lab: The lab directory, Lab2 or Lab3.
+    :param path: The path of the request.
+    :return: The milliseconds spent importing and responding, and the number of modules loaded.
+    """
+    env = dict(os.environ, STORAGE_BACKEND='datastore', DATASTORE_EMULATOR_HOST='localhost:8081',
+               GOOGLE_CLOUD_PROJECT='bench')
+    out = subprocess.run([sys.executable, '-c', CHILD, path], cwd=os.path.join(ROOT, lab), env=env,
+                         check=True, stdout=subprocess.PIPE, universal_newlines=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the cold start of a lab.')
+    parser.add_argument('--lab', choices=['Lab2', 'Lab3'], default='Lab3')
+    parser.add_argument('--path', default='/login', help='the path of the first request')
+    parser.add_argument('--runs', type=int, default=10, help='cold starts, the median is reported')
+    parser.add_argument('--output', help='file to write the results to as JSON')
+    parser.add_argument('--compare', help='results of a previous run to compare with')
+    args = parser.parse_args()
+
+    runs = [start(args.lab, args.path) for _ in range(args.runs)]
+    summary = {name: median([run[name] for run in runs]) for name in ('import_ms', 'first_response_ms', 'modules')}
+    summary['total_ms'] = summary['import_ms'] + summary['first_response_ms']
+    previous = None
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f)['results']
+    print('%s cold start, median of %d runs:' % (args.lab, args.runs))
+    for name in ('import_ms', 'first_response_ms', 'total_ms', 'modules'):
+        line = '  %-18s %9.1f' % (name, summary[name])
+        if previous is not None:
+            line += '  before %9.1f  (%+.1f%%)' % (previous[name], (summary[name] / previous[name] - 1) * 100)
+        print(line)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'config': vars(args), 'results': summary}, f, indent=2)